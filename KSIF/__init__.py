@@ -8,6 +8,7 @@ from . import core
 from .core import base, algos, backtest, ffn, data, utils
 
 from .core.backtest import Backtest, run
+from .core.sweep import sweep, walk_forward
 from .core.base import Strategy, Algo, AlgoStack
 from .core.algos import run_always
 from .core.ffn import utils, merge
@@ -1,7 +1,7 @@
 from __future__ import division
 from future.utils import iteritems
 import KSIF as kf
-from .base import Algo, AlgoStack
+from .base import Algo, AlgoStack, PanelCache
 import pandas as pd
 import numpy as np
 import random
@@ -428,6 +428,28 @@ class RunEveryNPeriods(Algo):
                 return False
 
 
+def _uses_cache(target, tickers=None):
+    """
+    True if the universe of target is its PanelCache's data (and contains
+    tickers), so that selections can use the cache's Listings.
+    """
+    cache = target.root.cache
+    return (cache is not None and target._universe is cache.data and
+            (tickers is None or cache.has(tickers)))
+
+
+def _history(target, tickers, lookback, lag):
+    """
+    Prices of tickers over [now - lag - lookback, now - lag], sliced with
+    the PanelCache's window index when possible.
+    """
+    cache = target.root.cache
+    if cache is not None and cache.has(tickers):
+        return cache.history(target.now, tickers, lookback, lag)
+    t0 = target.now - lag
+    return target.universe[tickers].ix[t0 - lookback:t0]
+
+
 class SelectAll(Algo):
     """
     Sets temp['selected'] with all securities (based on universe).
@@ -451,6 +473,8 @@ class SelectAll(Algo):
     def __call__(self, target):
         if self.include_no_data:
             target.temp['selected'] = target.universe.columns
+        elif _uses_cache(target):
+            target.temp['selected'] = target.root.cache.listed(target.now)
         else:
             universe = target.universe.ix[target.now].dropna()
             target.temp['selected'] = list(universe[universe > 0].index)
@@ -479,6 +503,9 @@ class SelectThese(Algo):
     def __call__(self, target):
         if self.include_no_data:
             target.temp['selected'] = self.tickers
+        elif _uses_cache(target, self.tickers):
+            target.temp['selected'] = target.root.cache.listed(
+                target.now, self.tickers)
         else:
             universe = target.universe[self.tickers].ix[target.now].dropna()
             target.temp['selected'] = list(universe[universe > 0].index)
@@ -534,6 +561,17 @@ class SelectHasData(Algo):
         else:
             selected = target.universe.columns
 
+        cache = target.root.cache
+        if cache is not None and cache.has(selected):
+            # counts from the window index of the cache
+            cnt = cache.count(target.now, selected, self.lookback)
+            ok = (cnt >= self.min_count).values
+            if not self.include_no_data:
+                i = cache.data.index.get_loc(target.now)
+                ok &= cache.values[i, cache.positions(selected)] > 0
+            target.temp['selected'] = list(cnt.index[ok])
+            return True
+
         filt = target.universe[selected].ix[target.now - self.lookback:]
         cnt = filt.count()
         cnt = cnt[cnt >= self.min_count]
@@ -542,6 +580,9 @@ class SelectHasData(Algo):
         target.temp['selected'] = list(cnt.index)
         return True
 
+    def precompute(self, cache):
+        cache.window(self.lookback)
+
 
 class SelectN(Algo):
     """
@@ -663,9 +704,13 @@ class SelectWhere(Algo):
             selected = sig.index[sig]
             # save as list
             if not self.include_no_data:
-                universe = target.universe[
-                    list(selected)].ix[target.now].dropna()
-                selected = list(universe[universe > 0].index)
+                selected = list(selected)
+                if _uses_cache(target, selected):
+                    selected = target.root.cache.listed(target.now, selected)
+                else:
+                    universe = target.universe[
+                        selected].ix[target.now].dropna()
+                    selected = list(universe[universe > 0].index)
             target.temp['selected'] = list(selected)
 
         return True
@@ -731,6 +776,9 @@ class StatTotalReturn(Algo):
     temp['selected'] over a given lookback period. The total return
     is determined by ffn's calc_total_return.
 
+    If the strategy tree has a PanelCache, total returns are computed once
+    for the whole universe and looked up by date.
+
     Args:
         * lookback (DateOffset): lookback period.
         * lag (DateOffset): Lag interval. Total return is calculated in
@@ -752,11 +800,199 @@ class StatTotalReturn(Algo):
 
     def __call__(self, target):
         selected = target.temp['selected']
+
+        # use precomputed panel unless some of the selected columns are not
+        # in the original data (strategy children for example)
+        cache = target.root.cache
+        if cache is not None and cache.has(selected):
+            panel = cache.total_return(self.lookback, self.lag)
+            target.temp['stat'] = panel.loc[target.now][selected]
+            return True
+
         t0 = target.now - self.lag
         prc = target.universe[selected].ix[t0 - self.lookback:t0]
         target.temp['stat'] = prc.calc_total_return()
         return True
 
+    def precompute(self, cache):
+        cache.total_return(self.lookback, self.lag)
+
+
+class StatFactor(Algo):
+    """
+    Sets temp['stat'] from a factor panel computed once for the universe.
+
+    fn computes the factor for every date and ticker at once. The panel is
+    computed the first time it is needed (or by precompute) and stored in
+    the strategy tree's PanelCache, after which each date only looks up
+    its row. Strategies sharing a PanelCache - all strategies of a sweep -
+    share panels with the same key, so a factor used by many parameter
+    sets is computed once.
+
+    Factors can be transformed and combined with StatRank, StatZScore and
+    StatCombine, whose panels are cached the same way. Tickers in
+    temp['selected'] that are not in the panel (strategy children for
+    example) get NaN, which SelectN drops.
+
+    Args:
+        * fn (fn(DataFrame) -> DataFrame): Computes the factor panel (dates
+            x tickers) from the universe. It must only use data available
+            on each date.
+        * key (hashable): Identifies the factor in the PanelCache. Defaults
+            to fn - pass a key when fn is created anew for every strategy
+            (lambdas in a sweep factory for example).
+
+    Sets:
+        * stat
+
+    Requires:
+        * selected
+
+    """
+
+    def __init__(self, fn=None, key=None):
+        super(StatFactor, self).__init__()
+        self.fn = fn
+        self.key = ('factor', fn if key is None else key)
+        # panels of strategies run without a PanelCache
+        self._cache = None
+
+    def __call__(self, target):
+        cache = target.root.cache
+        if cache is None:
+            if self._cache is None or self._cache.data is not target.universe:
+                self._cache = PanelCache(target.universe)
+            cache = self._cache
+
+        panel = self.panel(cache)
+        target.temp['stat'] = panel.loc[target.now].reindex(
+            target.temp['selected'])
+        return True
+
+    def panel(self, cache):
+        """
+        The factor panel, computed once per cache.
+        """
+        return cache.get(self.key, lambda data: self.calc(data, cache))
+
+    def calc(self, data, cache):
+        """
+        Computes the panel. Factors built on other factors get their panels
+        from cache.
+        """
+        return self.fn(data)
+
+    def precompute(self, cache):
+        self.panel(cache)
+
+
+class StatRank(StatFactor):
+    """
+    Sets temp['stat'] with the cross-sectional rank of a factor.
+
+    Ranks are computed for all dates at once over the tickers with a value
+    on each date (NaNs are kept, not ranked). See StatFactor.
+
+    Args:
+        * factor (StatFactor): Factor to rank
+        * pct (bool): Percentile ranks in (0, 1] instead of 1..n
+        * ascending (bool): Rank 1 is the lowest value
+
+    Sets:
+        * stat
+
+    Requires:
+        * selected
+
+    """
+
+    def __init__(self, factor, pct=True, ascending=True):
+        super(StatRank, self).__init__()
+        self.factor = factor
+        self.pct = pct
+        self.ascending = ascending
+        self.key = ('rank', factor.key, pct, ascending)
+
+    def calc(self, data, cache):
+        return self.factor.panel(cache).rank(
+            axis=1, pct=self.pct, ascending=self.ascending, na_option='keep')
+
+
+class StatZScore(StatFactor):
+    """
+    Sets temp['stat'] with the cross-sectional z-score of a factor.
+
+    Every date's values are standardized by the mean and standard deviation
+    of the tickers with a value on that date, for all dates at once. See
+    StatFactor.
+
+    Args:
+        * factor (StatFactor): Factor to standardize
+
+    Sets:
+        * stat
+
+    Requires:
+        * selected
+
+    """
+
+    def __init__(self, factor):
+        super(StatZScore, self).__init__()
+        self.factor = factor
+        self.key = ('zscore', factor.key)
+
+    def calc(self, data, cache):
+        panel = self.factor.panel(cache)
+        return panel.sub(panel.mean(axis=1), axis=0).div(
+            panel.std(axis=1), axis=0)
+
+
+class StatCombine(StatFactor):
+    """
+    Sets temp['stat'] with a weighted combination of factors.
+
+    The composite is the weighted mean of the factors available for each
+    ticker and date, NaN only where all factors are NaN. Usually combines
+    StatRank or StatZScore factors so that they are on the same scale. See
+    StatFactor.
+
+    Args:
+        * factors (list): StatFactor algos
+        * weights (list): Weight of each factor. Equal weights if None.
+
+    Sets:
+        * stat
+
+    Requires:
+        * selected
+
+    """
+
+    def __init__(self, factors, weights=None):
+        super(StatCombine, self).__init__()
+        if weights is None:
+            weights = [1.] * len(factors)
+        if len(weights) != len(factors):
+            raise ValueError('factors and weights must have the same length')
+        self.factors = factors
+        self.weights = weights
+        self.key = ('combine', tuple(f.key for f in factors), tuple(weights))
+
+    def calc(self, data, cache):
+        total = None
+        weight = None
+        for f, w in zip(self.factors, self.weights):
+            panel = f.panel(cache)
+            ok = panel.notnull()
+            value = panel.fillna(0.) * w
+            if total is None:
+                total, weight = value, ok * w
+            else:
+                total = total.add(value, fill_value=0.)
+                weight = weight.add(ok * w, fill_value=0.)
+        return total / weight.where(weight != 0)
+
 
 class WeighEqually(Algo):
     """
@@ -890,13 +1126,15 @@ class WeighInvVol(Algo):
             target.temp['weights'] = {selected[0]: 1.}
             return True
 
-        t0 = target.now - self.lag
-        prc = target.universe[selected].ix[t0 - self.lookback:t0]
+        prc = _history(target, selected, self.lookback, self.lag)
         tw = kf.ffn.calc_inv_vol_weights(
             prc.to_returns().dropna())
         target.temp['weights'] = tw.dropna()
         return True
 
+    def precompute(self, cache):
+        cache.window(self.lookback, self.lag)
+
 
 class WeighMeanVar(Algo):
     """
@@ -945,8 +1183,7 @@ class WeighMeanVar(Algo):
             target.temp['weights'] = {selected[0]: 1.}
             return True
 
-        t0 = target.now - self.lag
-        prc = target.universe[selected].ix[t0 - self.lookback:t0]
+        prc = _history(target, selected, self.lookback, self.lag)
         tw = kf.ffn.calc_mean_var_weights(
             prc.to_returns().dropna(), weight_bounds=self.bounds,
             covar_method=self.covar_method, rf=self.rf)
@@ -954,6 +1191,9 @@ class WeighMeanVar(Algo):
         target.temp['weights'] = tw.dropna()
         return True
 
+    def precompute(self, cache):
+        cache.window(self.lookback, self.lag)
+
 
 class WeighRandomly(Algo):
     """
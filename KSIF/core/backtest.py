@@ -2,6 +2,8 @@ from __future__ import division
 from copy import deepcopy
 import KSIF as kf
 import KSIF.core.ffn as ffn
+from KSIF.core.base import PanelCache
+from KSIF.core.profiling import AlgoProfiler, EngineCounters
 import pandas as pd
 import numpy as np
 from matplotlib import pyplot as plt
@@ -74,7 +76,8 @@ def benchmark_random(backtest, random_strategy, nsim=100):
     # create and run random backtests
     for i in range(nsim):
         random_strategy.name = 'random_%s' % i
-        rbt = kf.Backtest(random_strategy, data)
+        # share precomputed panels with the original backtest
+        rbt = kf.Backtest(random_strategy, data, cache=backtest.cache)
         rbt.run()
 
         bts.append(rbt)
@@ -85,6 +88,17 @@ def benchmark_random(backtest, random_strategy, nsim=100):
     return res
 
 
+def to_float32(data):
+    """
+    Return data with its float64 columns converted to float32, or data
+    itself if it has none, so converting twice does not copy.
+    """
+    cols = data.columns[(data.dtypes == np.float64).values]
+    if len(cols) == 0:
+        return data
+    return data.astype(dict((c, np.float32) for c in cols))
+
+
 class Backtest(object):
     """
     A Backtest combines a Strategy with data to
@@ -106,15 +120,36 @@ class Backtest(object):
             Strategy.
         * commissions (fn(quantity)): The commission function to be used.
         * progress_bar (Bool): Display progress bar while running backtest
+        * profile (bool): Record call counts and wall times of each Algo
+            while running. See AlgoProfiler.
+        * engine_counters (bool): Count node tree operations (updates,
+            allocations, commissions...) while running. See EngineCounters.
+        * cache (PanelCache): Precomputed panels of data. Pass the same
+            cache to backtests run on the same data to share them (sweeps
+            do this). A new one is created if None.
+        * float32 (bool): Store the universe (see to_float32), security
+            series and weights in float32, halving their memory. Cash,
+            capital and strategy values and prices are still accumulated
+            in float64, so only prices are rounded. Whole won prices below
+            2**24 are exact and give the same NAV as float64. Adjusted (non
+            integer) prices are rounded to about 6e-8 relative, which moves
+            the NAV by up to about 1e-7 relative (tests/test_backtest.py
+            checks that it stays below 1e-6). A cache passed along must
+            wrap to_float32(data).
 
     Attributes:
         * strategy (Strategy): The Backtest's Strategy. This will be a deepcopy
             of the Strategy that was passed in.
         * data (DataFrame): Data passed in
+        * cache (PanelCache): Precomputed panels of data
         * dates (DateTimeIndex): Data's index
         * initial_capital (float): Initial capital
         * name (str): Backtest name
         * stats (ffn.PerformanceStats): Performance statistics
+        * algo_stats (DataFrame): Per-algo call counts and wall times. None
+            unless profile is True.
+        * engine_stats (Series): Node tree operation counts. None unless
+            engine_counters is True.
         * has_run (bool): Run flag
         * weights (DataFrame): Weights of each component over time
         * security_weights (DataFrame): Weights of each security as a
@@ -127,7 +162,11 @@ class Backtest(object):
                  initial_capital=1000000.0,
                  commissions=True,
                  integer_positions=True,
-                 progress_bar=True):
+                 progress_bar=True,
+                 profile=False,
+                 engine_counters=False,
+                 cache=None,
+                 float32=False):
 
         if data.columns.duplicated().any():  # data column에 이름 같은게 있는지 체크
             cols = data.columns[data.columns.duplicated().tolist()].tolist()  # 중복되는 column 이름 고르기
@@ -140,11 +179,31 @@ class Backtest(object):
         self.strategy = deepcopy(strategy)
         self.strategy.use_integer_positions(integer_positions)
 
+        if float32:
+            data = to_float32(data)
+            # a cache built on an earlier to_float32(data) wraps an equal
+            # frame - use it so that the panels match the universe
+            if cache is not None and cache.data is not data and \
+                    cache.data.equals(data):
+                data = cache.data
+
+        if cache is None:
+            cache = PanelCache(data)
+        elif cache.data is not data:
+            if float32:
+                raise ValueError('cache must wrap to_float32(data) when '
+                                 'float32 is True')
+            raise ValueError('cache was built for a different data set')
+
         self.data = data
         self.dates = data.index
+        self.cache = cache
         self.initial_capital = initial_capital
         self.name = name if name is not None else strategy.name
         self.progress_bar = progress_bar
+        self.profile = profile
+        self.engine_counters = engine_counters
+        self.float32 = float32
 
         if commissions is True or commissions.lower() == 'high':
             self.strategy.set_commissions(commission_high)
@@ -156,6 +215,8 @@ class Backtest(object):
             self.strategy.set_commissions(commissions)
 
         self.stats = {}
+        self.algo_stats = None
+        self.engine_stats = None
         self._original_prices = None
         self._weights = None
         self._sweights = None
@@ -168,6 +229,15 @@ class Backtest(object):
         # set run flag
         self.has_run = True
 
+        # attach cache, profiler and counters to the root - algos and
+        # children find them there. They must be attached before setup so
+        # that paper trading strategies created in setup share them.
+        self.strategy.cache = self.cache
+        if self.profile:
+            self.strategy._profiler = AlgoProfiler()
+        if self.engine_counters:
+            self.strategy._counters = EngineCounters()
+
         # setup strategy
         self.strategy.setup(self.data)
 
@@ -198,6 +268,11 @@ class Backtest(object):
         self.stats = self.strategy.prices.calc_perf_stats()
         self._original_prices = self.strategy.prices
 
+        if self.profile:
+            self.algo_stats = self.strategy._profiler.stats
+        if self.engine_counters:
+            self.engine_stats = self.strategy._counters.stats
+
     @property
     def weights(self):
         """
@@ -209,6 +284,8 @@ class Backtest(object):
             vals = pd.DataFrame({x.full_name: x.values for x in
                                  self.strategy.members})
             vals = vals.div(self.strategy.values, axis=0)
+            if self.float32:
+                vals = vals.astype(np.float32)
             self._weights = vals
             return vals
 
@@ -241,6 +318,8 @@ class Backtest(object):
 
             # divide by root strategy values
             vals = vals.div(self.strategy.values, axis=0)
+            if self.float32:
+                vals = vals.astype(np.float32)
 
             # save for future use
             self._sweights = vals
@@ -1,5 +1,6 @@
 from __future__ import division
 import math
+import threading
 from copy import deepcopy
 
 import pandas as pd
@@ -132,6 +133,13 @@ class Node(object):
         # is security flag - used to avoid updating 0 pos securities
         self._issec = False
 
+        # optional AlgoProfiler and EngineCounters - only read on the root
+        self._profiler = None
+        self._counters = None
+
+        # PanelCache of precomputed universe panels - only read on the root
+        self.cache = None
+
     def __getitem__(self, key):
         return self.children[key]
 
@@ -433,6 +441,12 @@ class StrategyBase(Node):
             paper.parent = paper
             paper.root = paper
             paper._paper_trade = False
+            # paper runs on the same universe - share precomputed panels.
+            # Its algos and operations are profiled and counted with the
+            # backtest's.
+            paper.cache = self.root.cache
+            paper._profiler = self.root._profiler
+            paper._counters = self.root._counters
             paper.setup(self._original_data)
             paper.adjust(self._paper_amount)
             self._paper = paper
@@ -487,6 +501,7 @@ class StrategyBase(Node):
         """
         # resolve stale state
         self.root.stale = False
+        counters = self.root._counters
 
         # update helpers on date change
         # also set newpt flag
@@ -500,6 +515,12 @@ class StrategyBase(Node):
             self._last_fee = 0.0
             newpt = True
 
+        if counters is not None:
+            if newpt:
+                counters['strategy_update_new'] += 1
+            else:
+                counters['strategy_update_stale'] += 1
+
         # update now
         self.now = date
         if inow is None:
@@ -507,6 +528,8 @@ class StrategyBase(Node):
                 inow = 0
             else:
                 inow = self.data.index.get_loc(date)
+                if counters is not None:
+                    counters['get_loc'] += 1
 
         # update children if any and calculate value
         val = self._capital  # default if no children
@@ -599,6 +622,9 @@ class StrategyBase(Node):
                 commissions.
 
         """
+        if self.root._counters is not None:
+            self.root._counters['adjust'] += 1
+
         # adjust capital
         self._capital += amount
         self._last_fee += fee
@@ -633,9 +659,14 @@ class StrategyBase(Node):
             * update (bool): Force update.
 
         """
+        if self.root._counters is not None:
+            self.root._counters['strategy_allocate'] += 1
+
         # allocate to child
         if child is not None:
             if child not in self.children:
+                if self.root._counters is not None:
+                    self.root._counters['security_created'] += 1
                 c = SecurityBase(child)
                 c.setup(self._universe)
                 # update to bring up to speed
@@ -706,6 +737,8 @@ class StrategyBase(Node):
 
         # else make sure we have child
         if child not in self.children:
+            if self.root._counters is not None:
+                self.root._counters['security_created'] += 1
             c = SecurityBase(child)
             c.setup(self._universe)
             # update child to bring up to speed
@@ -922,12 +955,18 @@ class SecurityBase(Node):
         except KeyError:
             prices = None
 
+        # float32 universes (see Backtest's float32) are stored in float32
+        # as well. Current price, value and position stay python floats.
+        dtype = None
+        if prices is not None and prices.dtype == np.float32:
+            dtype = np.float32
+
         # setup internal data
         if prices is not None:
             self._prices = prices
             self.data = pd.DataFrame(index=universe.index,
                                      columns=['value', 'position'],
-                                     data=0.0)
+                                     data=0.0, dtype=dtype)
             self._prices_set = True
         else:
             self.data = pd.DataFrame(index=universe.index,
@@ -939,7 +978,7 @@ class SecurityBase(Node):
         self._positions = self.data['position']
 
         # add _outlay
-        self.data['outlay'] = 0.
+        self.data['outlay'] = np.zeros(len(self.data), dtype=dtype or float)
         self._outlays = self.data['outlay']
 
     @cy.locals(prc=cy.double)
@@ -952,14 +991,25 @@ class SecurityBase(Node):
         # do. Internal calls (stale root calls) have None data. Also want to
         # make sure date has not changed, because then we do indeed want to
         # update.
+        counters = self.root._counters
         if date == self.now and self._last_pos == self._position:
+            if counters is not None:
+                counters['security_update_skipped'] += 1
             return
 
+        if counters is not None:
+            if date != self.now:
+                counters['security_update_new'] += 1
+            else:
+                counters['security_update_stale'] += 1
+
         if inow is None:
             if date == 0:
                 inow = 0
             else:
                 inow = self.data.index.get_loc(date)
+                if counters is not None:
+                    counters['get_loc'] += 1
 
         # date change - update price
         if date != self.now:
@@ -967,7 +1017,9 @@ class SecurityBase(Node):
             self.now = date
 
             if self._prices_set:
-                self._price = self._prices.values[inow]
+                # python float - float32 prices must not lower the
+                # precision of values and capital
+                self._price = float(self._prices.values[inow])
             # traditional data update
             elif data is not None:
                 prc = data[self.name]
@@ -1025,6 +1077,9 @@ class SecurityBase(Node):
 
         """
 
+        if self.root._counters is not None:
+            self.root._counters['security_allocate'] += 1
+
         # will need to update if this has been idle for a while...
         # update if needupdate or if now is stale
         # fetch parent's now since our now is stale
@@ -1102,6 +1157,8 @@ class SecurityBase(Node):
             * p (float): price
 
         """
+        if self.root._counters is not None:
+            self.root._counters['commission'] += 1
         return self.parent.commission_fn(q, p)
 
     @cy.locals(q=cy.double)
@@ -1126,6 +1183,268 @@ class SecurityBase(Node):
         pass
 
 
+class PanelCache(object):
+
+    """
+    Store of (dates x tickers) panels precomputed from a backtest universe.
+
+    Algos that compute the same statistic on every date (rolling total
+    returns for example) can compute it once for the whole universe and
+    then only look up the row for the current date. A PanelCache is bound
+    to one data DataFrame and can be shared by every Backtest run on it,
+    which is what sweeps do - each distinct panel is then computed once
+    for all parameter combinations.
+
+    Backtest attaches its cache to the root strategy. Algos access it via
+    target.root.cache. Copies of a PanelCache (deepcopy) return the same
+    object, so paper trading strategies share it as well.
+
+    Args:
+        * data (DataFrame): The universe the panels are computed from.
+
+    Attributes:
+        * data (DataFrame): The universe
+        * columns (set): Columns of the universe
+
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.columns = set(data.columns)
+        self._panels = {}
+        self._lock = threading.RLock()
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def __contains__(self, key):
+        return key in self._panels
+
+    def __len__(self):
+        return len(self._panels)
+
+    def get(self, key, fn):
+        """
+        Return the panel stored under key, computing it with fn(data) if
+        it is not there yet.
+
+        Args:
+            * key (hashable): Panel key. Should include every parameter
+                that fn depends on.
+            * fn (fn(DataFrame)): Function computing the panel from the
+                universe.
+
+        """
+        try:
+            return self._panels[key]
+        except KeyError:
+            pass
+
+        # compute once even if several threads ask at the same time. The
+        # lock is reentrant: panels may be built from other panels.
+        with self._lock:
+            if key not in self._panels:
+                self._panels[key] = fn(self.data)
+            return self._panels[key]
+
+    def has(self, tickers):
+        """
+        True if all tickers are columns of the universe.
+        """
+        columns = self.columns
+        return all(t in columns for t in tickers)
+
+    @property
+    def values(self):
+        """
+        The universe as a 2-D array.
+        """
+        return self.get('values', lambda data: data.values)
+
+    def positions(self, tickers):
+        """
+        Column positions of tickers in the universe.
+        """
+        pos = self.get('positions', lambda data: dict(
+            (t, k) for k, t in enumerate(data.columns)))
+        return np.array([pos[t] for t in tickers], dtype=int)
+
+    def window(self, lookback, lag=None):
+        """
+        Window index of a lookback period: row positions start and end
+        (excluded) such that, on the date of row i, universe.ix[t0 -
+        lookback:t0] with t0 = now - lag is data.iloc[start[i]:end[i]].
+
+        DateOffset arithmetic and the searches are done once for all dates
+        instead of on every call.
+
+        Args:
+            * lookback (DateOffset): lookback period
+            * lag (DateOffset): lag interval. None for no lag.
+
+        Returns:
+            (start, end) ndarrays
+
+        """
+        def calc(data):
+            dates = data.index
+            t0 = dates if lag is None else dates - lag
+            start = dates.searchsorted(t0 - lookback, side='left')
+            end = dates.searchsorted(t0, side='right')
+            # algos see the universe up to now only
+            end = np.minimum(end, np.arange(1, len(dates) + 1))
+            return start, end
+
+        return self.get(('window', lookback, lag), calc)
+
+    def history(self, date, tickers, lookback, lag=None):
+        """
+        universe[tickers].ix[t0 - lookback:t0] with t0 = date - lag, sliced
+        with the window index. See window.
+        """
+        start, end = self.window(lookback, lag)
+        i = self.data.index.get_loc(date)
+        a, b = start[i], max(end[i], start[i])
+        return pd.DataFrame(self.values[a:b][:, self.positions(tickers)],
+                            index=self.data.index[a:b], columns=tickers)
+
+    def count(self, date, tickers, lookback, lag=None):
+        """
+        Number of valid prices of tickers in the window of date, i.e.
+        history(date, tickers, lookback, lag).count(), from a cumulative
+        count panel.
+        """
+        def calc(data):
+            valid = data.notnull().values
+            counts = np.zeros((len(valid) + 1, valid.shape[1]), dtype=int)
+            np.cumsum(valid, axis=0, out=counts[1:])
+            return counts
+
+        counts = self.get('valid_count', calc)
+        start, end = self.window(lookback, lag)
+        i = self.data.index.get_loc(date)
+        cols = self.positions(tickers)
+        cnt = counts[max(end[i], start[i]), cols] - counts[start[i], cols]
+        return pd.Series(cnt, index=tickers)
+
+    def total_return(self, lookback, lag):
+        """
+        Panel of total returns over [now - lag - lookback, now - lag] for
+        every date, i.e. the value ffn's calc_total_return gives on
+        universe.ix[t0 - lookback:t0] with t0 = now - lag.
+
+        Args:
+            * lookback (DateOffset): lookback period
+            * lag (DateOffset): lag interval
+
+        """
+        def calc(data):
+            start, end = self.window(lookback, lag)
+            end = end - 1
+
+            prc = self.values
+            with np.errstate(divide='ignore', invalid='ignore'):
+                res = prc[end] / prc[start] - 1
+            # empty windows
+            res[(end < start) | (end < 0)] = np.nan
+            return pd.DataFrame(res, index=data.index, columns=data.columns)
+
+        return self.get(('total_return', lookback, lag), calc)
+
+    @property
+    def listings(self):
+        """
+        Listings (interval index of listed periods) of the universe.
+        """
+        return self.get('listings', Listings)
+
+    def listed(self, date, tickers=None):
+        """
+        Tickers listed on date with a positive price, in universe order (or
+        the order of tickers) - what SelectAll selects.
+
+        Args:
+            * date: A date of the universe
+            * tickers (list): Only consider these tickers
+
+        """
+        listings = self.listings
+        i = self.data.index.get_loc(date)
+        values = self.values
+        if tickers is None:
+            cols = listings.alive(i)
+            return list(self.data.columns[cols[values[i, cols] > 0]])
+
+        cols = self.positions(tickers)
+        ok = ((listings.starts[cols] <= i) & (listings.ends[cols] >= i) &
+              (values[i, cols] > 0))
+        return [t for t, k in zip(tickers, ok) if k]
+
+
+class Listings(object):
+
+    """
+    Interval index of the listed period of each ticker of a universe.
+
+    A ticker is listed from its first to its last valid price, trading
+    halts (NaNs) in between included. In Korean universes with listings and
+    delistings, half of the panel can be outside listed periods. Finding
+    the tickers alive on a date only looks at tickers listed before it, in
+    a list sorted by listing date, instead of scanning the whole row.
+
+    Args:
+        * data (DataFrame): Universe
+
+    Attributes:
+        * columns (Index): Tickers
+        * starts (ndarray): First listed row of each ticker (len(data) if
+            never listed)
+        * ends (ndarray): Last listed row of each ticker (-1 if never
+            listed)
+
+    """
+
+    def __init__(self, data):
+        valid = data.notnull().values
+        n = len(valid)
+        listed = valid.any(axis=0)
+        self.columns = data.columns
+        self.starts = np.where(listed, valid.argmax(axis=0), n)
+        self.ends = np.where(listed, n - 1 - valid[::-1].argmax(axis=0), -1)
+        self._order = np.argsort(self.starts, kind='mergesort')
+        self._sorted_starts = self.starts[self._order]
+        self._positions = dict((t, k) for k, t in enumerate(self.columns))
+
+    def alive(self, i):
+        """
+        Column positions of the tickers listed on row i, in column order.
+        """
+        k = self._sorted_starts.searchsorted(i, side='right')
+        cols = self._order[:k]
+        return np.sort(cols[self.ends[cols] >= i])
+
+    def tickers(self, i):
+        """
+        Tickers listed on row i.
+        """
+        return self.columns[self.alive(i)]
+
+    def positions(self, tickers):
+        """
+        Column positions of tickers.
+        """
+        return np.array([self._positions[t] for t in tickers], dtype=int)
+
+
 class Algo(object):
 
     """
@@ -1161,6 +1480,14 @@ class Algo(object):
     def __call__(self, target):
         raise NotImplementedError("%s not implemented!" % self.name)
 
+    def precompute(self, cache):
+        """
+        Optional hook used to compute panels ahead of a run (see PanelCache).
+        Sweeps call it once per parameter set before starting workers so
+        that workers share the precomputed panels.
+        """
+        pass
+
 
 class AlgoStack(Algo):
 
@@ -1183,6 +1510,11 @@ class AlgoStack(Algo):
                                     for x in self.algos)
 
     def __call__(self, target):
+        # route calls through the profiler if one is attached to the tree
+        profiler = target.root._profiler
+        if profiler is not None:
+            return self._call(target, profiler.call)
+
         # normal runing mode
         if not self.check_run_always:
             for algo in self.algos:
@@ -1203,6 +1535,28 @@ class AlgoStack(Algo):
                         algo(target)
             return res
 
+    def _call(self, target, call):
+        # same logic as __call__ but every algo is invoked through call
+        if not self.check_run_always:
+            for algo in self.algos:
+                if not call(algo, target):
+                    return False
+            return True
+        else:
+            res = True
+            for algo in self.algos:
+                if res:
+                    res = call(algo, target)
+                elif hasattr(algo, 'run_always'):
+                    if algo.run_always:
+                        call(algo, target)
+            return res
+
+    def precompute(self, cache):
+        for algo in self.algos:
+            if hasattr(algo, 'precompute'):
+                algo.precompute(cache)
+
 
 class Strategy(StrategyBase):
 
@@ -1237,13 +1591,23 @@ class Strategy(StrategyBase):
         self.perm = {}
 
     def run(self):
+        # time the run if a profiler is attached to the tree
+        profiler = self.root._profiler
+        if profiler is not None:
+            profiler.run(self)
+        else:
+            self._run()
+
+    def _run(self):
         # clear out temp data
         # temp : AlgoStack을 돌릴 때 마다 생성되는 데이터 매개체
         self.temp = {}
 
         # run algo stack
-        self.stack(self)
+        res = self.stack(self)
 
         # run children
         for c in self._childrenv:
-            c.run()
\ No newline at end of file
+            c.run()
+
+        return res
\ No newline at end of file
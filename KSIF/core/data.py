@@ -2,8 +2,15 @@
 
 """
 
+from multiprocessing.pool import ThreadPool
+import os
+import threading
+import time
+import warnings
 from KSIF.core import ffn
+from KSIF.core.base import Listings
 import KSIF.core.utils as utils
+import numpy as np
 import pandas as pd
 from pandas_datareader import data as pdata
 
@@ -11,10 +18,11 @@ __author__ = 'Seung Hyeon Yu'
 __email__ = 'rambor12@business.kaist.ac.kr'
 
 
-@utils.memoize
+@utils.memoize(refresh_keyword=('mrefresh', 'incremental'))
 def get(tickers, provider=None, source='yahoo', common_dates=True, forward_fill=False,
         clean_tickers=True, column_names=None, ticker_field_sep=';',
-        mrefresh=False, merge_to=None, **kwargs):
+        mrefresh=False, merge_to=None, max_workers=1, retries=0,
+        timeout=None, incremental=False, **kwargs):
     """
     Helper function for retrieving data as a DataFrame.
 
@@ -38,6 +46,24 @@ def get(tickers, provider=None, source='yahoo', common_dates=True, forward_fill=
         * mrefresh (bool): Ignore memoization.
         * merge_to (DataFrame): Existing DataFrame to append returns
             to - used when we download from multiple sources
+        * max_workers (int): Number of tickers retrieved concurrently.
+            Downloads are dominated by network latency, so fetching in
+            threads speeds up large ticker lists. Columns keep the order
+            of tickers.
+        * retries (int): Number of times a failed ticker is retried
+            before the error is raised.
+        * timeout (float): Seconds allowed for each ticker (retries
+            included), counted from the start of its download, when
+            max_workers > 1. None waits forever. Ignored, with a warning,
+            when max_workers is 1 since a running download can not be
+            interrupted.
+        * incremental (bool): Only download the dates after the history
+            already cached by a memoized provider (from INCREMENTAL_OVERLAP
+            dates before its end, which must match the cached values) and
+            append them. Tickers without cached history, whose provider
+            does not take a start date or whose history was revised
+            (adjusted prices) are downloaded in full. Cached get results
+            containing updated tickers are dropped.
         * kwargs: passed to provider
 
     """
@@ -49,24 +75,15 @@ def get(tickers, provider=None, source='yahoo', common_dates=True, forward_fill=
 
     # load csv if the tickers is a path and set 'date' as index
     if '.csv' in tickers:
-        df = pd.read_csv(tickers, encoding='euc-kr', **kwargs)
-        if ('DATE' in df.columns) or ('date' in df.columns):
-            if 'date' in df.columns:
-                df = df.rename(columns={'date':'DATE'})
-            df = df.set_index(df.columns[df.columns.get_loc('DATE')])
-        else:
-            df = df.set_index(df.columns[0])
-        try:
-            df.index = pd.to_datetime(df.index)
-        except:
-            pass
-        mask = list(set(df.columns[df.dtypes == object]))
-        df[mask] = df[mask].applymap(utils.to_numeric)
-        return df
+        return read_csv(tickers, **kwargs)
 
     tickers = utils.parse_arg(tickers)
 
-    data = {}
+    if provider is csv and mrefresh:
+        # parse the file again once, not once per ticker
+        _forget_csv(kwargs.get('path', 'data.csv'))
+
+    calls = []
     for ticker in tickers:
         t = ticker
         f = None
@@ -78,12 +95,23 @@ def get(tickers, provider=None, source='yahoo', common_dates=True, forward_fill=
             f = bits[1]
 
         # call provider - check if supports memoization
+        kw = dict(kwargs, ticker=t, field=f, source=source)
         if hasattr(provider, 'mcache'):
-            data[ticker] = provider(ticker=t, field=f, source=source,
-                                    mrefresh=mrefresh, **kwargs)
-        else:
-            data[ticker] = provider(ticker=t, field=f, source=source,
-                                    **kwargs)
+            kw['mrefresh'] = mrefresh
+        calls.append(kw)
+
+    if incremental:
+        results = _fetch_all(provider, tickers, calls,
+                             max_workers=max_workers, retries=retries,
+                             timeout=timeout, fetch=_fetch_tail)
+        data = dict((t, r[0]) for t, r in results.items())
+        changed = set(t for t, r in results.items() if r[1])
+        if changed:
+            utils.memoize_forget(get, lambda args: not changed.isdisjoint(
+                utils.parse_arg(args['tickers'])))
+    else:
+        data = _fetch_all(provider, tickers, calls, max_workers=max_workers,
+                          retries=retries, timeout=timeout)
 
     df = pd.DataFrame(data)
     # ensure same order as provided
@@ -110,12 +138,240 @@ def get(tickers, provider=None, source='yahoo', common_dates=True, forward_fill=
     return df
 
 
+# rows parsed at a time by read_csv. Bounds the memory used by the text of
+# wide files before it is converted to numbers.
+CSV_CHUNKSIZE = 1000
+
+# parsed files kept by csv, least recently used evicted first
+CSV_MAX_FILES = 8
+
+
+def read_csv(path, chunksize=None, **kwargs):
+    """
+    Read a csv export of Korean data vendors: euc-kr encoded, dates in a
+    'DATE' (or 'date', or the first) column and numbers with thousands
+    separators. Used by get for .csv paths.
+
+    Numbers are parsed by pandas' C parser (thousands=','). Columns that
+    still hold text are converted column by column, keeping the cells
+    that are not numbers as text. The date format is detected once, from
+    the first date. The file is read chunksize rows at a time.
+
+    Args:
+        * path (str): csv file path
+        * chunksize (int): rows per chunk. Defaults to CSV_CHUNKSIZE.
+        * kwargs: passed to pandas.read_csv
+
+    Returns:
+        DataFrame
+
+    """
+    kwargs.setdefault('encoding', 'euc-kr')
+    kwargs.setdefault('thousands', ',')
+    reader = pd.read_csv(path, chunksize=chunksize or CSV_CHUNKSIZE,
+                         **kwargs)
+    chunks = [_csv_chunk(c) for c in reader]
+    if not chunks:
+        return pd.read_csv(path, **kwargs)
+    df = pd.concat(chunks) if len(chunks) > 1 else chunks[0]
+
+    try:
+        index = df.index
+        if index.dtype != object:
+            index = index.astype(str)
+        first = index[pd.notnull(index)][0]
+        df.index = pd.to_datetime(index, format=utils.get_form(first))
+    except Exception:
+        try:
+            df.index = pd.to_datetime(df.index)
+        except Exception:
+            pass
+    return df
+
+
+def _csv_chunk(df):
+    """
+    Set the date column as index and convert text columns to numbers.
+    """
+    if ('DATE' in df.columns) or ('date' in df.columns):
+        if 'date' in df.columns:
+            df = df.rename(columns={'date': 'DATE'})
+        df = df.set_index('DATE')
+    else:
+        df = df.set_index(df.columns[0])
+
+    for c in df.columns:
+        if not pd.api.types.is_numeric_dtype(df[c]):
+            df[c] = _to_numeric(df[c])
+    return df
+
+
+def _to_numeric(col):
+    """
+    Vectorized utils.to_numeric over a column of text.
+    """
+    num = pd.to_numeric(col.str.replace(',', ''), errors='coerce')
+    text = num.isnull() & col.notnull()
+    if text.any():
+        return col.astype(object).where(text, num)
+    return num
+
+
+# seconds to wait before the first retry. Doubles on every retry.
+RETRY_PAUSE = 0.5
+
+# seconds between checks of queued downloads when a timeout is set
+TIMEOUT_POLL = 0.05
+
+
+def _fetch(provider, kwargs, retries=0):
+    """
+    Call provider(**kwargs), retrying up to retries times on errors.
+    """
+    pause = RETRY_PAUSE
+    for attempt in range(retries + 1):
+        try:
+            return provider(**kwargs)
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(pause)
+            pause *= 2
+
+
+# number of cached dates downloaded again by incremental updates to check
+# that the cached history is still valid
+INCREMENTAL_OVERLAP = 5
+
+
+def _same(a, b):
+    """
+    True if the values of a and b (Series or DataFrames) match.
+    """
+    try:
+        return np.allclose(a.values, b.values, equal_nan=True)
+    except TypeError:
+        return a.equals(b)
+
+
+def _fetch_full(provider, kwargs, retries=0):
+    """
+    Download the whole history of provider(**kwargs), bypassing every
+    cache on the way (mrefresh only refreshes the provider's own cache),
+    and store it as the provider's cached result.
+    """
+    with utils.uncached():
+        data = _fetch(provider, kwargs, retries)
+    utils.memoize_set(provider, data, **kwargs)
+    return data
+
+
+def _fetch_tail(provider, kwargs, retries=0):
+    """
+    Extend the memoized history of provider(**kwargs) with the dates after
+    it. See get's incremental argument.
+
+    Returns:
+        (data, changed) - changed is False if nothing was added
+
+    """
+    kwargs = dict(kwargs)
+    kwargs.pop('mrefresh', None)
+    if not hasattr(provider, 'mcache'):
+        return _fetch(provider, kwargs, retries), True
+
+    code = utils.unwrap(provider).__code__
+    found, old = utils.memoize_get(provider, **kwargs)
+    if (not found or len(old) == 0 or
+            'start' not in code.co_varnames[:code.co_argcount]):
+        return _fetch_full(provider, kwargs, retries), True
+
+    # bypass the caches of the provider and of the functions it calls, so
+    # that tails are not cached on their own
+    start = old.index[max(len(old) - INCREMENTAL_OVERLAP, 0)]
+    with utils.uncached():
+        tail = _fetch(provider, dict(kwargs, start=start), retries)
+    tail = tail[tail.index >= start]
+    if len(tail) == 0:
+        return old, False
+
+    common = old.index.intersection(tail.index)
+    if len(common) == 0 or not _same(old.loc[common], tail.loc[common]):
+        # the tail does not connect or the history was revised (prices
+        # adjusted for a dividend or split) - download all of it
+        return _fetch_full(provider, kwargs, retries), True
+
+    data = pd.concat([old[old.index < tail.index[0]], tail])
+    if len(data) == len(old) and _same(data, old):
+        return old, False
+
+    utils.memoize_set(provider, data, **kwargs)
+    return data, True
+
+
+def _fetch_all(provider, tickers, calls, max_workers=1, retries=0,
+               timeout=None, fetch=_fetch):
+    """
+    Call the provider for every ticker, max_workers at a time.
+
+    Args:
+        * provider (function): Data provider
+        * tickers (list): Tickers, used as keys of the result
+        * calls (list): Provider keyword arguments of each ticker
+        * max_workers (int): Number of threads
+        * retries (int): Retries per ticker
+        * timeout (float): Seconds allowed for each ticker, from the start
+            of its download
+        * fetch (function): Called as fetch(provider, kwargs, retries)
+
+    Returns:
+        dict of ticker -> fetch result
+
+    """
+    serial = max_workers is None or max_workers <= 1
+    if serial and timeout is not None:
+        warnings.warn('timeout is ignored when max_workers is 1')
+    if serial or (len(calls) <= 1 and timeout is None):
+        return dict((ticker, fetch(provider, kw, retries))
+                    for ticker, kw in zip(tickers, calls))
+
+    # start time of each download, set by the worker running it
+    started = [None] * len(calls)
+
+    def run(k, kw):
+        started[k] = time.time()
+        return fetch(provider, kw, retries)
+
+    pool = ThreadPool(max(min(max_workers, len(calls)), 1))
+    try:
+        pending = [pool.apply_async(run, (k, kw))
+                   for k, kw in enumerate(calls)]
+        data = {}
+        for k, (ticker, res) in enumerate(zip(tickers, pending)):
+            while timeout is not None and not res.ready():
+                if started[k] is None:
+                    # still queued - the allowance has not started
+                    res.wait(min(timeout, TIMEOUT_POLL))
+                    continue
+                left = started[k] + timeout - time.time()
+                if left <= 0:
+                    raise ValueError(
+                        'timed out retrieving data for %s' % ticker)
+                res.wait(left)
+            data[ticker] = res.get()
+        return data
+    finally:
+        # does not wait for timed out downloads
+        pool.terminate()
+
+
 @utils.memoize
+@utils.disk_memoize
 def web(ticker, field=None, start=None, end=None,
         mrefresh=False, source='yahoo'):
     """
     Data provider wrapper around pandas.io.data provider. Provides
-    memoization.
+    memoization, and a disk cache if utils.set_cache_dir was called.
     """
     new_ticker, source = korean_ticker(ticker, source)
     if source == 'yahoo' and field is None:
@@ -124,7 +380,7 @@ def web(ticker, field=None, start=None, end=None,
         field = 'Close'
 
     tmp = _download_web(new_ticker, data_source=source,
-                        start=start, end=end)
+                        start=start, end=end, mrefresh=mrefresh)
 
     if tmp is None:
         raise ValueError('failed to retrieve data for %s:%s' % (ticker, field))
@@ -170,17 +426,58 @@ def korean_ticker(name, source):
 
 
 @utils.memoize
-def _download_web(name, **kwargs):
+def _download_web(name, mrefresh=False, **kwargs):
     """
     Thin wrapper to enable memoization
     """
     return pdata.DataReader(name, **kwargs)
 
 
-@utils.memoize
+@utils.memoize(refresh_keyword='refresh', max_entries=CSV_MAX_FILES)
+def _parse_csv(path, mtime, refresh=False, **kwargs):
+    """
+    Parsed csv file. mtime is part of the memoize key so that a modified
+    file is parsed again.
+    """
+    return pd.read_csv(path, **kwargs)
+
+
+_CSV_LOCK = threading.Lock()
+
+
+def _csv_file(path, refresh=False, **kwargs):
+    """
+    DataFrame of a csv file. The file is parsed once and again only when it
+    is modified (or refresh is True), however many columns are read.
+    """
+    path = os.path.abspath(path)
+    mtime = os.path.getmtime(path)
+    # parse under the lock so that concurrent get workers parse once
+    with _CSV_LOCK:
+        # drop what was parsed before the file was modified
+        utils.memoize_forget(_parse_csv, lambda args: (
+            args['path'] == path and args['mtime'] != mtime))
+        return _parse_csv(path, mtime, refresh=refresh, **kwargs)
+
+
+def _forget_csv(path):
+    """
+    Drop every parsed version of a csv file, so that it is parsed again on
+    its next read.
+    """
+    path = os.path.abspath(path)
+    with _CSV_LOCK:
+        utils.memoize_forget(_parse_csv, lambda args: args['path'] == path)
+
+
 def csv(ticker, path='data.csv', field='', mrefresh=False, source=None, **kwargs):
     """
-    Data provider wrapper around pandas' read_csv. Provides memoization.
+    Data provider wrapper around pandas' read_csv. Each file is parsed
+    once per modification and columns are returned without copying, so
+    they should not be modified in place. The last CSV_MAX_FILES parsed
+    files are kept in the memoize cache of _parse_csv
+    (utils.clear_memoize(_parse_csv) empties it). mrefresh parses the file
+    again. get(..., mrefresh=True) parses it once for all its tickers.
     """
     # set defaults if not specified
     if 'index_col' not in kwargs:
@@ -189,7 +486,7 @@ def csv(ticker, path='data.csv', field='', mrefresh=False, source=None, **kwargs
         kwargs['parse_dates'] = True
 
     # read in dataframe from csv file
-    df = pd.read_csv(path, **kwargs)
+    df = _csv_file(path, refresh=mrefresh, **kwargs)
 
     tf = ticker
     if field is not '' and field is not None:
@@ -202,4 +499,247 @@ def csv(ticker, path='data.csv', field='', mrefresh=False, source=None, **kwargs
     return df[tf]
 
 
+class PanelStore(object):
+
+    """
+    Directory of memory-mapped panels (dates x tickers), one file per field.
+
+    Each field is stored as a column-major .npy file, so a ticker's whole
+    history is contiguous on disk, plus dates.npy (the date index) and
+    tickers.txt (the ticker dictionary, one ticker per line, in column
+    order). Integer tickers (KRX codes, for example) are also saved as
+    tickers.npy so that they are read back as integers. get() maps the
+    files instead of reading them: only the pages of the requested
+    tickers and dates are ever read, and reads are shared with other
+    processes through the OS page cache.
+
+    Panels returned by get() wrap the mapped file without copying when
+    the tickers are contiguous in the store (all tickers, for example) and
+    can be passed to Backtest as data. They are read only.
+
+    Args:
+        * path (str): Store directory, written by PanelStore.write
+
+    Attributes:
+        * path (str): Store directory
+        * dates (DatetimeIndex): Dates of the store
+        * tickers (list): Tickers of the store
+        * fields (list): Fields of the store, in the order written
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.dates = pd.DatetimeIndex(
+            np.load(os.path.join(path, 'dates.npy')))
+        if os.path.exists(os.path.join(path, 'tickers.npy')):
+            self.tickers = np.load(os.path.join(path, 'tickers.npy')).tolist()
+        else:
+            self.tickers = self._read_list('tickers.txt')
+        self.fields = self._read_list('fields.txt')
+        self._columns = dict((t, i) for i, t in enumerate(self.tickers))
+        self._panels = {}
+
+    def _read_list(self, name):
+        with open(os.path.join(self.path, name), 'rb') as f:
+            return f.read().decode('utf-8').splitlines()
+
+    @staticmethod
+    def write(path, data, field='close'):
+        """
+        Write panels to a store directory (created if needed) and return
+        the store.
+
+        Args:
+            * path (str): Store directory
+            * data (DataFrame, dict): Panel of dates x tickers, or dict of
+                field -> panel. Panels are aligned to the dates and
+                tickers of the first one. Tickers must be strings or
+                integers.
+            * field (str): Field name if data is a single panel
+
+        """
+        if isinstance(data, pd.DataFrame):
+            data = {field: data}
+            fields = [field]
+        else:
+            fields = list(data.keys())
+        first = data[fields[0]]
+
+        kind = first.columns.inferred_type
+        if kind not in ('string', 'unicode', 'integer'):
+            raise ValueError('tickers must be strings or integers, got %s'
+                             % kind)
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        np.save(os.path.join(path, 'dates.npy'),
+                pd.DatetimeIndex(first.index).values.astype('datetime64[ns]'))
+        for name, values in (('tickers.txt', first.columns),
+                             ('fields.txt', fields)):
+            with open(os.path.join(path, name), 'wb') as f:
+                f.write('\n'.join(str(v) for v in values).encode('utf-8'))
+        # tickers.txt can not tell 5930 from '5930'
+        int_tickers = os.path.join(path, 'tickers.npy')
+        if kind == 'integer':
+            np.save(int_tickers, np.asarray(first.columns, dtype=np.int64))
+        elif os.path.exists(int_tickers):
+            os.remove(int_tickers)
+
+        for name in fields:
+            panel = data[name].reindex(index=first.index,
+                                       columns=first.columns)
+            out = np.lib.format.open_memmap(
+                os.path.join(path, name + '.npy'), mode='w+',
+                dtype=panel.values.dtype, shape=panel.shape,
+                fortran_order=True)
+            out[:] = panel.values
+            out.flush()
+            del out
+
+        return PanelStore(path)
+
+    def panel(self, field=None):
+        """
+        The whole memory-mapped array (dates x tickers) of a field.
+        """
+        if field is None:
+            field = self.fields[0]
+        if field not in self._panels:
+            if field not in self.fields:
+                raise ValueError('field %s not in store' % field)
+            self._panels[field] = np.load(
+                os.path.join(self.path, field + '.npy'), mmap_mode='r')
+        return self._panels[field]
+
+    def get(self, tickers=None, start=None, end=None, field=None):
+        """
+        Load a panel of the store.
+
+        Args:
+            * tickers (list, string, csv string): Tickers to load. All
+                tickers if None.
+            * start, end (date): Date range (inclusive). All dates if None.
+            * field (str): Field to load. The first field if None.
+
+        Returns:
+            DataFrame
+
+        """
+        values = self.panel(field)
+
+        i = 0 if start is None else self.dates.searchsorted(
+            pd.Timestamp(start))
+        j = len(self.dates) if end is None else self.dates.searchsorted(
+            pd.Timestamp(end), side='right')
+        index = self.dates[i:j]
+
+        if tickers is None:
+            return pd.DataFrame(values[i:j], index=index,
+                                columns=self.tickers, copy=False)
+
+        tickers = utils.parse_arg(tickers)
+        if np.ndim(tickers) == 0:
+            # a single integer ticker
+            tickers = [tickers]
+        missing = [t for t in tickers if t not in self._columns]
+        if missing:
+            raise ValueError('tickers not in store: %s' % missing)
+        cols = np.array([self._columns[t] for t in tickers], dtype=int)
+
+        if len(cols) and (np.diff(cols) == 1).all():
+            # contiguous tickers - a view of the file
+            sub = values[i:j, cols[0]:cols[-1] + 1]
+        else:
+            # reads only the requested columns. Taken from the transpose so
+            # that the result is column-major like the file.
+            sub = values.T[cols, i:j].T
+        return pd.DataFrame(sub, index=index, columns=tickers, copy=False)
+
+
+class SparseUniverse(object):
+
+    """
+    Universe stored as the listed period of each ticker.
+
+    Only the prices between each ticker's first and last valid price are
+    kept, one after the other in a single array - universes of every
+    ticker ever listed are often half NaN in dense form. Which tickers are
+    alive on a date is answered by a Listings interval index.
+
+    Prices of a date, of a ticker or of a smaller dense panel (a date
+    range and ticker subset to backtest on) are read without building the
+    full dense panel.
+
+    Args:
+        * data (DataFrame): Dense universe
+
+    Attributes:
+        * index (DatetimeIndex): Dates
+        * columns (Index): Tickers
+        * listings (Listings): Listed periods
+        * nbytes (int): Memory used by the prices
+
+    """
+
+    def __init__(self, data):
+        self.index = data.index
+        self.columns = data.columns
+        self.listings = listings = Listings(data)
+
+        values = data.values
+        lengths = np.maximum(listings.ends - listings.starts + 1, 0)
+        self._offsets = np.concatenate([[0], np.cumsum(lengths)])
+        self._values = np.empty(self._offsets[-1], dtype=values.dtype)
+        for k in np.flatnonzero(lengths):
+            self._values[self._offsets[k]:self._offsets[k + 1]] = \
+                values[listings.starts[k]:listings.ends[k] + 1, k]
+
+    @property
+    def nbytes(self):
+        return self._values.nbytes + self._offsets.nbytes
+
+    def column(self, ticker):
+        """
+        Prices of ticker on every date (NaN outside its listed period).
+        """
+        return self.to_dense(tickers=[ticker])[ticker]
+
+    def row(self, date):
+        """
+        Prices of the tickers listed on date.
+        """
+        i = self.index.get_loc(date)
+        cols = self.listings.alive(i)
+        values = self._values[self._offsets[cols] + i -
+                              self.listings.starts[cols]]
+        return pd.Series(values, index=self.columns[cols], name=date)
+
+    def to_dense(self, tickers=None, start=None, end=None):
+        """
+        Dense panel of tickers (all if None) between start and end
+        (inclusive, all dates if None).
+        """
+        i = 0 if start is None else self.index.searchsorted(
+            pd.Timestamp(start))
+        j = len(self.index) if end is None else self.index.searchsorted(
+            pd.Timestamp(end), side='right')
+        if tickers is None:
+            cols = np.arange(len(self.columns))
+        else:
+            tickers = utils.parse_arg(tickers)
+            cols = self.listings.positions(tickers)
+
+        out = np.full((j - i, len(cols)), np.nan, dtype=self._values.dtype)
+        starts, ends = self.listings.starts, self.listings.ends
+        for c, k in enumerate(cols):
+            a = max(starts[k], i)
+            b = min(ends[k] + 1, j)
+            if a < b:
+                o = self._offsets[k] - starts[k]
+                out[a - i:b - i, c] = self._values[o + a:o + b]
+        return pd.DataFrame(out, index=self.index[i:j],
+                            columns=self.columns[cols])
+
+
 DEFAULT_PROVIDER = web
@@ -2,8 +2,10 @@
 
 """
 from __future__ import print_function
-from future.utils import listvalues
+import multiprocessing
 import random
+import warnings
+import weakref
 from KSIF.core import utils
 from .utils import fmtp, fmtn, fmtpn, get_period_name
 import numpy as np
@@ -15,7 +17,6 @@ import sklearn.manifold
 import sklearn.cluster
 import sklearn.covariance
 from scipy.optimize import minimize
-import scipy.stats
 from scipy.stats import t
 try:
     import prettyplotlib  # NOQA
@@ -35,23 +36,101 @@ def set_riskfree_rate(rf, update_all=False):
 
     Args:
         * rf (float): Annual interest rate
-        * update_all (bool): If True, all instances of PerformanceStats
-            will update their values. Note, this might be very slow
-            time in case of many objects available
+        * update_all (bool): If True, all live instances of
+            PerformanceStats and GroupStats are set to this rate. Only
+            their rate dependent stats (Sharpe ratios) are updated, so
+            this is cheap even with many objects available.
 
     """
 
-    # Note that both daily and monthly rates are annualized in the same
-    # way as returns
-    PerformanceStats._yearly_rf = rf
-    PerformanceStats._monthly_rf = (np.power(1+rf, 1./12.) - 1.) * 12
-    PerformanceStats._daily_rf = (np.power(1+rf, 1./252.) - 1.) * 252
+    (PerformanceStats._yearly_rf, PerformanceStats._monthly_rf,
+     PerformanceStats._daily_rf) = _riskfree_rates(rf)
 
     if update_all:
-        from gc import get_objects
-        for obj in get_objects():
-            if isinstance(obj, PerformanceStats):
-                obj.set_riskfree_rate(rf)
+        for obj in list(_REGISTRY.values()):
+            obj.set_riskfree_rate(rf)
+
+
+# live PerformanceStats and GroupStats objects by id, for
+# set_riskfree_rate(update_all=True). Entries go away with their objects.
+_REGISTRY = weakref.WeakValueDictionary()
+
+
+def _riskfree_rates(rf):
+    """
+    Yearly, monthly and daily rates for an annual risk-free rate.
+    """
+    # Note that both daily and monthly rates are annualized in the same
+    # way as returns
+    return (rf, (np.power(1+rf, 1./12.) - 1.) * 12,
+            (np.power(1+rf, 1./252.) - 1.) * 252)
+
+
+# (attribute, label, format) of the stats reported by PerformanceStats and
+# GroupStats. None rows are blank lines in display and to_csv.
+_STATS = [('start', 'Start', 'dt'),
+          ('end', 'End', 'dt'),
+          ('_yearly_rf', 'Risk-free rate', 'p'),
+          (None, None, None),
+          ('total_return', 'Total Return', 'p'),
+          ('daily_sharpe', 'Daily Sharpe', 'n'),
+          ('cagr', 'CAGR', 'p'),
+          ('max_drawdown', 'Max Drawdown', 'p'),
+          (None, None, None),
+          ('mtd', 'MTD', 'p'),
+          ('three_month', '3m', 'p'),
+          ('six_month', '6m', 'p'),
+          ('ytd', 'YTD', 'p'),
+          ('one_year', '1Y', 'p'),
+          ('three_year', '3Y (ann.)', 'p'),
+          ('five_year', '5Y (ann.)', 'p'),
+          ('ten_year', '10Y (ann.)', 'p'),
+          ('incep', 'Since Incep. (ann.)', 'p'),
+          (None, None, None),
+          ('daily_sharpe', 'Daily Sharpe', 'n'),
+          ('daily_mean', 'Daily Mean (ann.)', 'p'),
+          ('daily_vol', 'Daily Vol (ann.)', 'p'),
+          ('daily_skew', 'Daily Skew', 'n'),
+          ('daily_kurt', 'Daily Kurt', 'n'),
+          ('best_day', 'Best Day', 'p'),
+          ('worst_day', 'Worst Day', 'p'),
+          (None, None, None),
+          ('monthly_sharpe', 'Monthly Sharpe', 'n'),
+          ('monthly_mean', 'Monthly Mean (ann.)', 'p'),
+          ('monthly_vol', 'Monthly Vol (ann.)', 'p'),
+          ('monthly_skew', 'Monthly Skew', 'n'),
+          ('monthly_kurt', 'Monthly Kurt', 'n'),
+          ('best_month', 'Best Month', 'p'),
+          ('worst_month', 'Worst Month', 'p'),
+          (None, None, None),
+          ('yearly_sharpe', 'Yearly Sharpe', 'n'),
+          ('yearly_mean', 'Yearly Mean', 'p'),
+          ('yearly_vol', 'Yearly Vol', 'p'),
+          ('yearly_skew', 'Yearly Skew', 'n'),
+          ('yearly_kurt', 'Yearly Kurt', 'n'),
+          ('best_year', 'Best Year', 'p'),
+          ('worst_year', 'Worst Year', 'p'),
+          (None, None, None),
+          ('avg_drawdown', 'Avg. Drawdown', 'p'),
+          ('avg_drawdown_days', 'Avg. Drawdown Days', 'n'),
+          ('avg_up_month', 'Avg. Up Month', 'p'),
+          ('avg_down_month', 'Avg. Down Month', 'p'),
+          ('win_year_perc', 'Win Year %', 'p'),
+          ('twelve_month_win_perc', 'Win 12m %', 'p')]
+
+# unique stat keys in report order - the rows of the stats tables
+_STAT_KEYS = []
+for _k, _, _ in _STATS:
+    if _k is not None and _k not in _STAT_KEYS:
+        _STAT_KEYS.append(_k)
+
+_MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep',
+           'Oct', 'Nov', 'Dec']
+
+# (attribute, label) of the lookback returns
+_LOOKBACKS = [('mtd', 'mtd'), ('three_month', '3m'), ('six_month', '6m'),
+              ('ytd', 'ytd'), ('one_year', '1y'), ('three_year', '3y'),
+              ('five_year', '5y'), ('ten_year', '10y'), ('cagr', 'incep')]
 
 
 class PerformanceStats(object):
@@ -62,6 +141,11 @@ class PerformanceStats(object):
     to help with plotting and contains a large amount of descriptive
     statistics.
 
+    Stats are calculated lazily: each stat, and the intermediate series it
+    depends on (returns, monthly prices, drawdown...), is calculated on
+    first access and then kept. Creating a PerformanceStats to read a few
+    stats (e.g. cagr and daily_sharpe) is therefore cheap.
+
     Args:
         * prices (Series): A price series.
 
@@ -89,319 +173,382 @@ class PerformanceStats(object):
         self._end = self.prices.index[-1]
 
         self._update(self.prices)
+        _REGISTRY[id(self)] = self
 
     def set_riskfree_rate(self, rf):
 
         """
         Set annual risk-free rate property and calculate properly annualized
-        monthly and daily rates. Then performance stats are recalculated.
-        Affects only this instance of the PerformanceStats.
+        monthly and daily rates. Then the stats that depend on the rate are
+        recalculated (on access). Affects only this instance of the
+        PerformanceStats.
 
         Args:
             * rf (float): Annual risk-free rate
         """
 
-        self._yearly_rf = rf
-        self._monthly_rf = (np.power(1+rf, 1./12.) - 1.) * 12
-        self._daily_rf = (np.power(1+rf, 1./252.) - 1.) * 252
+        self._yearly_rf, self._monthly_rf, self._daily_rf = _riskfree_rates(rf)
+
+        for name in self._RF_FIELDS:
+            self.__dict__.pop(name, None)
+
+    # stats that depend on the risk-free rate
+    _RF_FIELDS = ('daily_sharpe', 'monthly_sharpe', 'yearly_sharpe', 'stats')
+
+    # Stats are calculated lazily, on first access, and stored on the
+    # instance. The level of a stat is the minimum history it requires (see
+    # _reached) - stats above the level of the prices are NaN. None means
+    # the stat is always calculated.
+    _FIELDS = {
+        'daily_prices': None, 'ytd': None, 'return_table': None,
+        'lookback_returns': None, 'stats': None,
+        'start': 0, 'end': 0, 'monthly_prices': 0, 'yearly_prices': 0,
+        'returns': 1, 'log_returns': 1, 'daily_mean': 1, 'daily_vol': 1,
+        'daily_sharpe': 1, 'best_day': 1, 'worst_day': 1,
+        'total_return': 1, 'cagr': 1, 'incep': 1, 'drawdown': 1,
+        'max_drawdown': 1, 'drawdown_details': 1, 'avg_drawdown': 1,
+        'avg_drawdown_days': 1,
+        'daily_skew': 2, 'daily_kurt': 2, 'monthly_returns': 2,
+        'monthly_mean': 3, 'monthly_vol': 3, 'monthly_sharpe': 3,
+        'best_month': 3, 'worst_month': 3, 'mtd': 3, 'pos_month_perc': 3,
+        'avg_up_month': 3, 'avg_down_month': 3,
+        'three_month': 4,
+        'monthly_skew': 5, 'monthly_kurt': 5, 'six_month': 5,
+        'yearly_returns': 5,
+        'one_year': 6, 'yearly_mean': 6, 'yearly_vol': 6,
+        'yearly_sharpe': 6, 'best_year': 6, 'worst_year': 6,
+        'three_year': 6, 'win_year_perc': 6, 'twelve_month_win_perc': 6,
+        'yearly_skew': 7, 'yearly_kurt': 7, 'five_year': 7, 'ten_year': 7}
+
+    def __getattr__(self, name):
+        # only called for attributes not in the instance dict, i.e. stats
+        # that were not calculated yet
+        if name not in self._FIELDS:
+            raise AttributeError("'%s' object has no attribute '%s'" %
+                                 (self.__class__.__name__, name))
+
+        if self._reached(self._FIELDS[name]):
+            value = getattr(self, '_calc_' + name)()
+        else:
+            value = np.nan
+        self.__dict__[name] = value
+        return value
+
+    def _update(self, obj, window=None):
+        # drop calculated stats - they are recalculated from obj on access
+        for name in self._FIELDS:
+            self.__dict__.pop(name, None)
+        self._obj = obj
+        self._window = window
+
+    def _range_stats(self):
+        # prefix structures over all prices, only used for date ranges
+        # (set_date_range) of prices without NaN
+        if self._window is None or len(self._obj) < 2:
+            return None
+        if '_ranges' not in self.__dict__:
+            self._ranges = None
+            if not self.prices.isnull().any():
+                self._ranges = _RangeStats(self.prices)
+        return self._ranges
+
+    def _reached(self, level):
+        """
+        Whether the prices are long enough for stats of a level. Levels
+        are: 0 - one day, 1 - two days, 2 - four days, 3/4/5 - two/three/four
+        months (and four days), 6 - two years, 7 - four years.
+        """
+        if level is None:
+            return True
+        if len(self._obj) < (1, 2, 4)[min(level, 2)]:
+            return False
+        if level >= 3 and len(self.monthly_prices) < min(level - 1, 4):
+            return False
+        if level >= 6 and len(self.yearly_prices) < (2 if level == 6 else 4):
+            return False
+        return True
+
+    def get_stats(self, keys=None):
+        """
+        Returns a Series of stats. Only the requested stats (and what they
+        depend on) are calculated.
 
-        # Note, that we recalculate everything.
-        self._update(self.prices)
+        Args:
+            * keys (list): Stat names, e.g. ['cagr', 'daily_sharpe']. If
+                None, all stats are returned (same as stats).
+
+        """
+        if keys is None:
+            keys = _STAT_KEYS
+        return pd.Series([getattr(self, k) for k in keys], keys)
+
+    def rolling_sharpe(self, window, rf=None):
+        """
+        Daily Sharpe ratio over a trailing window (int or DateOffset)
+        ending at every date. See ffn.rolling_sharpe.
+        """
+        if rf is None:
+            rf = self._yearly_rf
+        return rolling_sharpe(self.daily_prices, window, rf)
+
+    def rolling_vol(self, window):
+        """
+        Annualized volatility over a trailing window. See ffn.rolling_vol.
+        """
+        return rolling_vol(self.daily_prices, window)
+
+    def rolling_cagr(self, window):
+        """
+        CAGR over a trailing window. See ffn.rolling_cagr.
+        """
+        return rolling_cagr(self.daily_prices, window)
+
+    def rolling_max_drawdown(self, window):
+        """
+        Max drawdown over a trailing window. See ffn.rolling_max_drawdown.
+        """
+        return rolling_max_drawdown(self.daily_prices, window)
 
-    def _update(self, obj):
-        # calc
-        self._calculate(obj)
-
-        # update derived structure
-        # return table as dataframe for easier manipulation
-        self.return_table = pd.DataFrame(self.return_table).T
-        # name columns
-        if len(self.return_table.columns) == 13:
-            self.return_table.columns = ['Jan', 'Feb', 'Mar', 'Apr', 'May',
-                                         'Jun', 'Jul', 'Aug', 'Sep', 'Oct',
-                                         'Nov', 'Dec', 'YTD']
-
-        self.lookback_returns = pd.Series(
-            [self.mtd, self.three_month, self.six_month, self.ytd,
-             self.one_year, self.three_year, self.five_year,
-             self.ten_year, self.cagr],
-            ['mtd', '3m', '6m', 'ytd', '1y', '3y', '5y', '10y', 'incep'])
-        self.lookback_returns.name = self.name
-
-        st = self._stats()
-        self.stats = pd.Series(
-            [getattr(self, x[0]) for x in st if x[0] is not None],
-            [x[0] for x in st if x[0] is not None]).drop_duplicates()
-
-    def _calculate(self, obj):
-        # default values
-        self.daily_mean = np.nan
-        self.daily_vol = np.nan
-        self.daily_sharpe = np.nan
-        self.best_day = np.nan
-        self.worst_day = np.nan
-        self.total_return = np.nan
-        self.cagr = np.nan
-        self.incep = np.nan
-        self.drawdown = np.nan
-        self.max_drawdown = np.nan
-        self.drawdown_details = np.nan
-        self.daily_skew = np.nan
-        self.daily_kurt = np.nan
-        self.monthly_returns = np.nan
-        self.avg_drawdown = np.nan
-        self.avg_drawdown_days = np.nan
-        self.monthly_mean = np.nan
-        self.monthly_vol = np.nan
-        self.monthly_sharpe = np.nan
-        self.best_month = np.nan
-        self.worst_month = np.nan
-        self.mtd = np.nan
-        self.three_month = np.nan
-        self.pos_month_perc = np.nan
-        self.avg_up_month = np.nan
-        self.avg_down_month = np.nan
-        self.monthly_skew = np.nan
-        self.monthly_kurt = np.nan
-        self.six_month = np.nan
-        self.yearly_returns = np.nan
-        self.ytd = np.nan
-        self.one_year = np.nan
-        self.yearly_mean = np.nan
-        self.yearly_vol = np.nan
-        self.yearly_sharpe = np.nan
-        self.best_year = np.nan
-        self.worst_year = np.nan
-        self.three_year = np.nan
-        self.win_year_perc = np.nan
-        self.twelve_month_win_perc = np.nan
-        self.yearly_skew = np.nan
-        self.yearly_kurt = np.nan
-        self.five_year = np.nan
-        self.ten_year = np.nan
-
-        self.return_table = {}
-        # end default values
-
-        if len(obj) is 0:
-            return
-
-        self.start = obj.index[0]
-        self.end = obj.index[-1]
-
-        # save daily prices for future use
-        self.daily_prices = obj
+    def rolling_beta(self, benchmark, window):
+        """
+        Beta against benchmark prices over a trailing window. See
+        ffn.rolling_beta.
+        """
+        return rolling_beta(self.daily_prices, benchmark, window)
+
+    @staticmethod
+    def _kurt(r):
+        # if all zero/nan kurt fails division by zero
+        if len(r[(~np.isnan(r)) & (r != 0)]) > 0:
+            return r.kurt()
+        return np.nan
+
+    def _since(self, offset):
+        # return since the last price on or before offset from the end
+        p = self.daily_prices
+        denom = p[:p.index[-1] - offset]
+        if len(denom) > 0:
+            return p[-1] / denom[-1] - 1
+        return np.nan
+
+    def _calc_daily_prices(self):
+        return self._obj
+
+    def _calc_start(self):
+        return self._obj.index[0]
+
+    def _calc_end(self):
+        return self._obj.index[-1]
+
+    def _calc_monthly_prices(self):
         # M = month end frequency
-        self.monthly_prices = obj.resample('M').last()
+        return self.daily_prices.resample('M').last()
+
+    def _calc_yearly_prices(self):
         # A == year end frequency
-        self.yearly_prices = obj.resample('A').last()
+        return self.daily_prices.resample('A').last()
 
-        # let's save some typing
-        p = obj
-        mp = self.monthly_prices
-        yp = self.yearly_prices
+    # stats using daily data
 
-        if len(p) is 1:
-            return
+    def _calc_returns(self):
+        return self.daily_prices.to_returns()
 
-        # stats using daily data
-        self.returns = p.to_returns()
-        self.log_returns = p.to_log_returns()
-        r = self.returns
+    def _calc_log_returns(self):
+        return self.daily_prices.to_log_returns()
 
-        if len(r) < 2:
-            return
+    def _calc_daily_mean(self):
+        ranges = self._range_stats()
+        if ranges is not None:
+            return ranges.mean(*self._window) * 252
+        return self.returns.mean() * 252
 
-        self.daily_mean = r.mean() * 252
-        self.daily_vol = r.std() * np.sqrt(252)
-        self.daily_sharpe = (self.daily_mean - self._daily_rf) / self.daily_vol
-        self.best_day = r.max()
-        self.worst_day = r.min()
+    def _calc_daily_vol(self):
+        ranges = self._range_stats()
+        if ranges is not None:
+            return ranges.std(*self._window) * np.sqrt(252)
+        return self.returns.std() * np.sqrt(252)
 
-        self.total_return = obj[-1] / obj[0] - 1
-        # save ytd as total_return for now - if we get to real ytd
-        # then it will get updated
-        self.ytd = self.total_return
-        self.cagr = calc_cagr(p)
-        self.incep = self.cagr
+    def _calc_daily_sharpe(self):
+        return (self.daily_mean - self._daily_rf) / self.daily_vol
 
-        self.drawdown = p.to_drawdown_series()
-        self.max_drawdown = self.drawdown.min()
-        self.drawdown_details = drawdown_details(self.drawdown)
-        if self.drawdown_details is not None:
-            self.avg_drawdown = self.drawdown_details['drawdown'].mean()
-            self.avg_drawdown_days = self.drawdown_details['days'].mean()
+    def _calc_best_day(self):
+        return self.returns.max()
 
-        if len(r) < 4:
-            return
+    def _calc_worst_day(self):
+        return self.returns.min()
 
-        self.daily_skew = r.skew()
+    def _calc_total_return(self):
+        ranges = self._range_stats()
+        if ranges is not None:
+            return ranges.total_return(*self._window)
+        return self.daily_prices[-1] / self.daily_prices[0] - 1
 
-        # if all zero/nan kurt fails division by zero
-        if len(r[(~np.isnan(r)) & (r != 0)]) > 0:
-            self.daily_kurt = r.kurt()
+    def _calc_ytd(self):
+        if self._reached(6):
+            return self.daily_prices[-1] / self.yearly_prices[-2] - 1
+        # total return if there is no full year
+        if self._reached(1):
+            return self.total_return
+        return np.nan
 
-        # stats using monthly data
-        self.monthly_returns = self.monthly_prices.to_returns()
-        mr = self.monthly_returns
+    def _calc_cagr(self):
+        ranges = self._range_stats()
+        if ranges is not None:
+            return ranges.cagr(*self._window)
+        return calc_cagr(self.daily_prices)
+
+    def _calc_incep(self):
+        return self.cagr
 
-        if len(mr) < 2:
-            return
+    def _calc_drawdown(self):
+        return self.daily_prices.to_drawdown_series()
 
-        self.monthly_mean = mr.mean() * 12
-        self.monthly_vol = mr.std() * np.sqrt(12)
-        self.monthly_sharpe = ((self.monthly_mean - self._monthly_rf) /
-                               self.monthly_vol)
-        self.best_month = mr.max()
-        self.worst_month = mr.min()
+    def _calc_max_drawdown(self):
+        ranges = self._range_stats()
+        if ranges is not None:
+            return ranges.max_drawdown(*self._window)
+        return self.drawdown.min()
 
+    def _calc_drawdown_details(self):
+        return drawdown_details(self.drawdown)
+
+    def _calc_avg_drawdown(self):
+        if self.drawdown_details is None:
+            return np.nan
+        return self.drawdown_details['drawdown'].mean()
+
+    def _calc_avg_drawdown_days(self):
+        if self.drawdown_details is None:
+            return np.nan
+        return self.drawdown_details['days'].mean()
+
+    def _calc_daily_skew(self):
+        return self.returns.skew()
+
+    def _calc_daily_kurt(self):
+        return self._kurt(self.returns)
+
+    # stats using monthly data
+
+    def _calc_monthly_returns(self):
+        return self.monthly_prices.to_returns()
+
+    def _calc_monthly_mean(self):
+        return self.monthly_returns.mean() * 12
+
+    def _calc_monthly_vol(self):
+        return self.monthly_returns.std() * np.sqrt(12)
+
+    def _calc_monthly_sharpe(self):
+        return (self.monthly_mean - self._monthly_rf) / self.monthly_vol
+
+    def _calc_best_month(self):
+        return self.monthly_returns.max()
+
+    def _calc_worst_month(self):
+        return self.monthly_returns.min()
+
+    def _calc_mtd(self):
         # -2 because p[-1] will be mp[-1]
-        self.mtd = p[-1] / mp[-2] - 1
+        return self.daily_prices[-1] / self.monthly_prices[-2] - 1
 
+    def _calc_pos_month_perc(self):
+        mr = self.monthly_returns
         # -1 here to account for first return that will be nan
-        self.pos_month_perc = len(mr[mr > 0]) / float(len(mr) - 1)
-        self.avg_up_month = mr[mr > 0].mean()
-        self.avg_down_month = mr[mr <= 0].mean()
-
-        # return_table
-        for idx in mr.index:
-            if idx.year not in self.return_table:
-                self.return_table[idx.year] = {1: 0, 2: 0, 3: 0,
-                                               4: 0, 5: 0, 6: 0,
-                                               7: 0, 8: 0, 9: 0,
-                                               10: 0, 11: 0, 12: 0}
-            if not np.isnan(mr[idx]):
-                self.return_table[idx.year][idx.month] = mr[idx]
-        # add first month
-        fidx = mr.index[0]
-        try:
-            self.return_table[fidx.year][fidx.month] = float(mp[0]) / p[0] - 1
-        except ZeroDivisionError:
-            self.return_table[fidx.year][fidx.month] = 0
-        # calculate the YTD values
-        for idx in self.return_table:
-            arr = np.array(listvalues(self.return_table[idx]))
-            self.return_table[idx][13] = np.prod(arr + 1) - 1
-
-        if len(mr) < 3:
-            return
-
-        denom = p[:p.index[-1] - pd.DateOffset(months=3)]
-        if len(denom) > 0:
-            self.three_month = p[-1] / denom[-1] - 1
+        return len(mr[mr > 0]) / float(len(mr) - 1)
 
-        if len(mr) < 4:
-            return
+    def _calc_avg_up_month(self):
+        mr = self.monthly_returns
+        return mr[mr > 0].mean()
 
-        self.monthly_skew = mr.skew()
+    def _calc_avg_down_month(self):
+        mr = self.monthly_returns
+        return mr[mr <= 0].mean()
 
-        # if all zero/nan kurt fails division by zero
-        if len(mr[(~np.isnan(mr)) & (mr != 0)]) > 0:
-            self.monthly_kurt = mr.kurt()
+    def _calc_return_table(self):
+        if not self._reached(3):
+            return pd.DataFrame()
+        return calc_return_table(self.daily_prices, self.monthly_prices)
 
-        denom = p[:p.index[-1] - pd.DateOffset(months=6)]
-        if len(denom) > 0:
-            self.six_month = p[-1] / denom[-1] - 1
+    def _calc_three_month(self):
+        return self._since(pd.DateOffset(months=3))
 
-        self.yearly_returns = self.yearly_prices.to_returns()
-        yr = self.yearly_returns
+    def _calc_monthly_skew(self):
+        return self.monthly_returns.skew()
 
-        if len(yr) < 2:
-            return
+    def _calc_monthly_kurt(self):
+        return self._kurt(self.monthly_returns)
 
-        self.ytd = p[-1] / yp[-2] - 1
+    def _calc_six_month(self):
+        return self._since(pd.DateOffset(months=6))
 
-        denom = p[:p.index[-1] - pd.DateOffset(years=1)]
-        if len(denom) > 0:
-            self.one_year = p[-1] / denom[-1] - 1
+    def _calc_twelve_month_win_perc(self):
+        mp = self.monthly_prices.values
+        if len(mp) < 12:
+            return np.nan
+        return (mp[11:] / mp[:-11] > 1).sum() / float(len(mp) - 11)
+
+    # stats using yearly data
+
+    def _calc_yearly_returns(self):
+        return self.yearly_prices.to_returns()
 
-        self.yearly_mean = yr.mean()
-        self.yearly_vol = yr.std()
-        self.yearly_sharpe = ((self.yearly_mean - self._yearly_rf) /
-                              self.yearly_vol)
-        self.best_year = yr.max()
-        self.worst_year = yr.min()
+    def _calc_one_year(self):
+        return self._since(pd.DateOffset(years=1))
 
-        # annualize stat for over 1 year
-        self.three_year = calc_cagr(p[p.index[-1] - pd.DateOffset(years=3):])
+    def _calc_yearly_mean(self):
+        return self.yearly_returns.mean()
 
+    def _calc_yearly_vol(self):
+        return self.yearly_returns.std()
+
+    def _calc_yearly_sharpe(self):
+        return (self.yearly_mean - self._yearly_rf) / self.yearly_vol
+
+    def _calc_best_year(self):
+        return self.yearly_returns.max()
+
+    def _calc_worst_year(self):
+        return self.yearly_returns.min()
+
+    def _calc_win_year_perc(self):
+        yr = self.yearly_returns
         # -1 here to account for first return that will be nan
-        self.win_year_perc = len(yr[yr > 0]) / float(len(yr) - 1)
+        return len(yr[yr > 0]) / float(len(yr) - 1)
 
-        tot = 0
-        win = 0
-        for i in range(11, len(mr)):
-            tot = tot + 1
-            if mp[i] / mp[i - 11] > 1:
-                win = win + 1
-        self.twelve_month_win_perc = float(win) / tot
+    def _calc_yearly_skew(self):
+        return self.yearly_returns.skew()
 
-        if len(yr) < 4:
-            return
+    def _calc_yearly_kurt(self):
+        return self._kurt(self.yearly_returns)
 
-        self.yearly_skew = yr.skew()
+    # annualize stat for over 1 year
 
-        # if all zero/nan kurt fails division by zero
-        if len(yr[(~np.isnan(yr)) & (yr != 0)]) > 0:
-            self.yearly_kurt = yr.kurt()
+    def _calc_three_year(self):
+        p = self.daily_prices
+        return calc_cagr(p[p.index[-1] - pd.DateOffset(years=3):])
 
-        self.five_year = calc_cagr(p[p.index[-1] - pd.DateOffset(years=5):])
-        self.ten_year = calc_cagr(p[p.index[-1] - pd.DateOffset(years=10):])
+    def _calc_five_year(self):
+        p = self.daily_prices
+        return calc_cagr(p[p.index[-1] - pd.DateOffset(years=5):])
 
-        return
+    def _calc_ten_year(self):
+        p = self.daily_prices
+        return calc_cagr(p[p.index[-1] - pd.DateOffset(years=10):])
+
+    # tables
+
+    def _calc_lookback_returns(self):
+        res = pd.Series([getattr(self, k) for k, _ in _LOOKBACKS],
+                        [n for _, n in _LOOKBACKS])
+        res.name = self.name
+        return res
+
+    def _calc_stats(self):
+        return self.get_stats()
 
     def _stats(self):
-        stats = [('start', 'Start', 'dt'),
-                 ('end', 'End', 'dt'),
-                 ('_yearly_rf', 'Risk-free rate', 'p'),
-                 (None, None, None),
-                 ('total_return', 'Total Return', 'p'),
-                 ('daily_sharpe', 'Daily Sharpe', 'n'),
-                 ('cagr', 'CAGR', 'p'),
-                 ('max_drawdown', 'Max Drawdown', 'p'),
-                 (None, None, None),
-                 ('mtd', 'MTD', 'p'),
-                 ('three_month', '3m', 'p'),
-                 ('six_month', '6m', 'p'),
-                 ('ytd', 'YTD', 'p'),
-                 ('one_year', '1Y', 'p'),
-                 ('three_year', '3Y (ann.)', 'p'),
-                 ('five_year', '5Y (ann.)', 'p'),
-                 ('ten_year', '10Y (ann.)', 'p'),
-                 ('incep', 'Since Incep. (ann.)', 'p'),
-                 (None, None, None),
-                 ('daily_sharpe', 'Daily Sharpe', 'n'),
-                 ('daily_mean', 'Daily Mean (ann.)', 'p'),
-                 ('daily_vol', 'Daily Vol (ann.)', 'p'),
-                 ('daily_skew', 'Daily Skew', 'n'),
-                 ('daily_kurt', 'Daily Kurt', 'n'),
-                 ('best_day', 'Best Day', 'p'),
-                 ('worst_day', 'Worst Day', 'p'),
-                 (None, None, None),
-                 ('monthly_sharpe', 'Monthly Sharpe', 'n'),
-                 ('monthly_mean', 'Monthly Mean (ann.)', 'p'),
-                 ('monthly_vol', 'Monthly Vol (ann.)', 'p'),
-                 ('monthly_skew', 'Monthly Skew', 'n'),
-                 ('monthly_kurt', 'Monthly Kurt', 'n'),
-                 ('best_month', 'Best Month', 'p'),
-                 ('worst_month', 'Worst Month', 'p'),
-                 (None, None, None),
-                 ('yearly_sharpe', 'Yearly Sharpe', 'n'),
-                 ('yearly_mean', 'Yearly Mean', 'p'),
-                 ('yearly_vol', 'Yearly Vol', 'p'),
-                 ('yearly_skew', 'Yearly Skew', 'n'),
-                 ('yearly_kurt', 'Yearly Kurt', 'n'),
-                 ('best_year', 'Best Year', 'p'),
-                 ('worst_year', 'Worst Year', 'p'),
-                 (None, None, None),
-                 ('avg_drawdown', 'Avg. Drawdown', 'p'),
-                 ('avg_drawdown_days', 'Avg. Drawdown Days', 'n'),
-                 ('avg_up_month', 'Avg. Up Month', 'p'),
-                 ('avg_down_month', 'Avg. Down Month', 'p'),
-                 ('win_year_perc', 'Win Year %', 'p'),
-                 ('twelve_month_win_perc', 'Win 12m %', 'p')]
-
-        return stats
+        return list(_STATS)
 
     def set_date_range(self, start=None, end=None):
         """
@@ -424,7 +571,11 @@ class PerformanceStats(object):
         else:
             end = pd.to_datetime(end)
 
-        self._update(self.prices.ix[start:end])
+        # positions of the range - stats that have prefix structures (see
+        # _RangeStats) are answered from them instead of the sliced prices
+        i = int(self.prices.index.searchsorted(start, side='left'))
+        j = int(self.prices.index.searchsorted(end, side='right')) - 1
+        self._update(self.prices.iloc[i:j + 1], window=(i, j))
 
     def display(self):
         """
@@ -607,7 +758,9 @@ class GroupStats(dict):
 
     The order of the series passed in will be preserved.
     Individual PerformanceStats objects can be accessed via index
-    position or name via the [] accessor.
+    position or name via the [] accessor. They are created on first
+    access - the stats and lookback_returns tables are calculated for all
+    series at once (see calc_group_stats).
 
     Args:
         * prices (Series): Multiple price series to be compared.
@@ -619,6 +772,7 @@ class GroupStats(dict):
             lookback periods (1m, 3m, 6m, ytd...)
             Period in rows, series in columns.
         * prices (DataFrame): The merged and rebased prices.
+        * return_tables (dict): Monthly return tables by series.
 
     """
 
@@ -649,6 +803,11 @@ class GroupStats(dict):
         self._end = self._prices.index[-1]
         # calculate stats for entire series
         self._update(self._prices)
+        _REGISTRY[id(self)] = self
+
+    # Annual risk-free rate set with set_riskfree_rate. None means the
+    # PerformanceStats default.
+    _yearly_rf = None
 
     def __getitem__(self, key):
         if type(key) == int:
@@ -656,74 +815,72 @@ class GroupStats(dict):
         else:
             return self.get(key)
 
+    def get(self, key, default=None):
+        if key not in self._names:
+            return default
+        # PerformanceStats of a single series are only created when
+        # accessed - the stats tables do not need them
+        if not dict.__contains__(self, key):
+            stats = PerformanceStats(self._prices[key])
+            if self._yearly_rf is not None:
+                stats.set_riskfree_rate(self._yearly_rf)
+            if len(self.prices) < len(self._prices):
+                stats.set_date_range(self.prices.index[0],
+                                     self.prices.index[-1])
+            dict.__setitem__(self, key, stats)
+        return dict.__getitem__(self, key)
+
+    def __contains__(self, key):
+        return key in self._names
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def keys(self):
+        return list(self._names)
+
+    def values(self):
+        return [self[k] for k in self._names]
+
+    def items(self):
+        return [(k, self[k]) for k in self._names]
+
     def _update(self, data):
         self._calculate(data)
         # lookback returns dataframe
-        self.lookback_returns = pd.DataFrame(
-            {x.lookback_returns.name: x.lookback_returns for x in
-             self.values()})
-
-        self.stats = pd.DataFrame(
-            {x.name: x.stats for x in self.values()})
+        self.lookback_returns = self.stats.loc[
+            [k for k, _ in _LOOKBACKS]].astype(float)
+        self.lookback_returns.index = [n for _, n in _LOOKBACKS]
 
     def _calculate(self, data):
         self.prices = data
-        for c in data.columns:
-            prc = data[c]
-            self[c] = PerformanceStats(prc)
+        # drop stale per series stats
+        dict.clear(self)
+        self._return_tables = None
+        self.stats = calc_group_stats(data, rf=self._yearly_rf)
+
+    @property
+    def return_tables(self):
+        """
+        Dict of monthly return tables (see PerformanceStats.return_table)
+        by series, calculated for all series at once on first access.
+        """
+        if self._return_tables is None:
+            p = self.prices
+            mp = p.resample('M').last()
+            # same requirement as PerformanceStats.return_table
+            if len(p) < 4 or len(mp) < 2:
+                self._return_tables = dict(
+                    (c, pd.DataFrame()) for c in p.columns)
+            else:
+                self._return_tables = calc_return_table(p, mp)
+        return self._return_tables
 
     def _stats(self):
-        stats = [('start', 'Start', 'dt'),
-                 ('end', 'End', 'dt'),
-                 ('_yearly_rf', 'Risk-free rate', 'p'),
-                 (None, None, None),
-                 ('total_return', 'Total Return', 'p'),
-                 ('daily_sharpe', 'Daily Sharpe', 'n'),
-                 ('cagr', 'CAGR', 'p'),
-                 ('max_drawdown', 'Max Drawdown', 'p'),
-                 (None, None, None),
-                 ('mtd', 'MTD', 'p'),
-                 ('three_month', '3m', 'p'),
-                 ('six_month', '6m', 'p'),
-                 ('ytd', 'YTD', 'p'),
-                 ('one_year', '1Y', 'p'),
-                 ('three_year', '3Y (ann.)', 'p'),
-                 ('five_year', '5Y (ann.)', 'p'),
-                 ('ten_year', '10Y (ann.)', 'p'),
-                 ('incep', 'Since Incep. (ann.)', 'p'),
-                 (None, None, None),
-                 ('daily_sharpe', 'Daily Sharpe', 'n'),
-                 ('daily_mean', 'Daily Mean (ann.)', 'p'),
-                 ('daily_vol', 'Daily Vol (ann.)', 'p'),
-                 ('daily_skew', 'Daily Skew', 'n'),
-                 ('daily_kurt', 'Daily Kurt', 'n'),
-                 ('best_day', 'Best Day', 'p'),
-                 ('worst_day', 'Worst Day', 'p'),
-                 (None, None, None),
-                 ('monthly_sharpe', 'Monthly Sharpe', 'n'),
-                 ('monthly_mean', 'Monthly Mean (ann.)', 'p'),
-                 ('monthly_vol', 'Monthly Vol (ann.)', 'p'),
-                 ('monthly_skew', 'Monthly Skew', 'n'),
-                 ('monthly_kurt', 'Monthly Kurt', 'n'),
-                 ('best_month', 'Best Month', 'p'),
-                 ('worst_month', 'Worst Month', 'p'),
-                 (None, None, None),
-                 ('yearly_sharpe', 'Yearly Sharpe', 'n'),
-                 ('yearly_mean', 'Yearly Mean', 'p'),
-                 ('yearly_vol', 'Yearly Vol', 'p'),
-                 ('yearly_skew', 'Yearly Skew', 'n'),
-                 ('yearly_kurt', 'Yearly Kurt', 'n'),
-                 ('best_year', 'Best Year', 'p'),
-                 ('worst_year', 'Worst Year', 'p'),
-                 (None, None, None),
-                 ('avg_drawdown', 'Avg. Drawdown', 'p'),
-                 ('avg_drawdown_days', 'Avg. Drawdown Days', 'n'),
-                 ('avg_up_month', 'Avg. Up Month', 'p'),
-                 ('avg_down_month', 'Avg. Down Month', 'p'),
-                 ('win_year_perc', 'Win Year %', 'p'),
-                 ('twelve_month_win_perc', 'Win 12m %', 'p')]
-
-        return stats
+        return list(_STATS)
 
     def set_riskfree_rate(self, rf):
 
@@ -736,8 +893,19 @@ class GroupStats(dict):
         Args:
             * rf (float): Annual risk-free rate
         """
-        for key in self._names:
-            self[key].set_riskfree_rate(rf)
+        self._yearly_rf = rf
+        for stats in dict.values(self):
+            stats.set_riskfree_rate(rf)
+
+        # only the rate dependent rows of the stats table change
+        yearly, monthly, daily = _riskfree_rates(rf)
+        st = self.stats
+        st.loc['_yearly_rf'] = yearly
+        for per, r in [('daily', daily), ('monthly', monthly),
+                       ('yearly', yearly)]:
+            st.loc[per + '_sharpe'] = (
+                (st.loc[per + '_mean'].astype(float) - r) /
+                st.loc[per + '_vol'].astype(float))
 
     def set_date_range(self, start=None, end=None):
         """
@@ -759,7 +927,13 @@ class GroupStats(dict):
         else:
             end = pd.to_datetime(end)
 
+        children = dict(dict.items(self))
         self._update(self._prices.ix[start:end])
+        # keep the series stats created so far - they answer the new range
+        # from their prefix structures
+        for key, stats in children.items():
+            stats.set_date_range(start, end)
+            dict.__setitem__(self, key, stats)
 
     def display(self):
         """
@@ -782,7 +956,7 @@ class GroupStats(dict):
 
             row = [n]
             for key in self._names:
-                raw = getattr(self[key], k)
+                raw = self.stats.at[k, key]
                 if f is None:
                     row.append(raw)
                 elif f == 'p':
@@ -919,7 +1093,7 @@ class GroupStats(dict):
 
             row = [n]
             for key in self._names:
-                raw = getattr(self[key], k)
+                raw = self.stats.at[k, key]
                 if f is None:
                     row.append(raw)
                 elif f == 'p':
@@ -941,6 +1115,267 @@ class GroupStats(dict):
             return res
 
 
+class _RangeStats(object):
+
+    """
+    Prefix structures over prices answering stats of any range of
+    positions [i, j] without touching the prices in between. Used by
+    PerformanceStats.set_date_range and the rolling_* functions.
+
+    Prices can be a Series or a DataFrame (stats per column). i and j can
+    be ints or arrays of positions, answering many ranges at once.
+
+    * total return and CAGR: O(1) from the prices at i and j
+    * mean and volatility of daily returns: O(1) from cumulative counts,
+      sums and sums of squares of returns (NaN returns are skipped).
+      Returns are centered on their overall mean first, which keeps the
+      variance accurate.
+    * max drawdown: O(log n) from sparse tables of the max, min and max
+      drawdown of every block of 2^k prices. A range is split into at most
+      log(n) disjoint blocks, merged left to right. The tables are built on
+      the first max_drawdown call, so the other stats never pay for them.
+
+    """
+
+    def __init__(self, prices):
+        p = np.asarray(prices.values, dtype=float)
+        self.prices = p
+        self.dates = prices.index
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r = p[1:] / p[:-1] - 1
+        ok = ~np.isnan(r)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            center = np.nanmean(r, axis=0) if len(r) > 0 else 0.
+        self._center = np.where(np.isnan(center), 0., center)
+        d = np.where(ok, r - self._center, 0.)
+        # prefix[k] is the sum over the returns into positions 1..k
+        zero = np.zeros((1,) + p.shape[1:])
+        self._count = np.concatenate([zero, np.cumsum(ok, axis=0)])
+        self._sum = np.concatenate([zero, np.cumsum(d, axis=0)])
+        self._sumsq = np.concatenate([zero, np.cumsum(d * d, axis=0)])
+
+        # sparse tables of max_drawdown, see _build_tables
+        self._max = None
+        self._min = None
+        self._dd = None
+
+    def _build_tables(self):
+        # level k holds blocks [i, i + 2^k). NaN prices are skipped.
+        p = self.prices
+        fmax, fmin = [p], [p]
+        fdd = [np.where(np.isnan(p), np.nan, 0.)]
+        h = 1
+        with np.errstate(divide='ignore', invalid='ignore'):
+            while 2 * h <= len(p):
+                mx, mn, dd = fmax[-1], fmin[-1], fdd[-1]
+                a, b = slice(0, len(mx) - h), slice(h, len(mx))
+                fmax.append(np.fmax(mx[a], mx[b]))
+                fmin.append(np.fmin(mn[a], mn[b]))
+                fdd.append(np.fmin(np.fmin(dd[a], dd[b]),
+                                   mn[b] / mx[a] - 1))
+                h *= 2
+        # _dd last - it marks the tables as built
+        self._max, self._min, self._dd = fmax, fmin, fdd
+
+    def _per_range(self, x):
+        # broadcast a value per range against the columns
+        x = np.asarray(x)
+        return x.reshape(x.shape + (1,) * (self.prices.ndim - 1))
+
+    def total_return(self, i, j):
+        return self.prices[j] / self.prices[i] - 1
+
+    def cagr(self, i, j):
+        dates = self.dates.values
+        # year_frac
+        frac = (dates[j] - dates[i]) / np.timedelta64(1, 's') / 31557600.
+        return ((self.prices[j] / self.prices[i]) **
+                (1. / self._per_range(frac)) - 1)
+
+    def mean(self, i, j):
+        # mean of the returns into positions i + 1..j
+        c = self._count[j] - self._count[i]
+        s = self._sum[j] - self._sum[i]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(c < 1, np.nan, s / c + self._center)[()]
+
+    def std(self, i, j):
+        c = self._count[j] - self._count[i]
+        s = self._sum[j] - self._sum[i]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            var = (self._sumsq[j] - self._sumsq[i] - s * s / c) / (c - 1)
+            return np.where(c < 2, np.nan, np.sqrt(np.maximum(var, 0.)))[()]
+
+    def max_drawdown(self, i, j):
+        if self._dd is None:
+            self._build_tables()
+        i = np.asarray(i)
+        length = np.asarray(j) - i + 1
+        pos = i.copy()
+        shape = i.shape + self.prices.shape[1:]
+        res = np.repeat(np.nan, int(np.prod(shape))).reshape(shape)
+        peak = res.copy()
+        # blocks from the highest bit of the length down, i.e. left to right
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for k in range(len(self._dd) - 1, -1, -1):
+                take = (length >> k) & 1 == 1
+                if not take.any():
+                    continue
+                at = pos[take]
+                res[take] = np.fmin(res[take], np.fmin(
+                    self._dd[k][at], self._min[k][at] / peak[take] - 1))
+                peak[take] = np.fmax(peak[take], self._max[k][at])
+                pos[take] += 1 << k
+        return res[()]
+
+
+def _window_starts(index, window):
+    """
+    Start positions of the trailing windows ending at each date, and
+    whether each window is complete.
+
+    Args:
+        * index (DatetimeIndex): dates
+        * window (int or DateOffset): number of prices in the window, or
+            the length of the window in time (prices on or after
+            date - window)
+
+    """
+    n = len(index)
+    if isinstance(window, (int, np.integer)):
+        start = np.arange(n) - (window - 1)
+        return np.maximum(start, 0), start >= 0
+    first = index - window
+    return (index.searchsorted(first, side='left'),
+            np.asarray(first >= index[0]))
+
+
+def _rolling(prices, window, fn):
+    # fn(start, end) -> stats of the windows [start, end]. Only called if
+    # there is a complete window.
+    start, complete = _window_starts(prices.index, window)
+    end = np.arange(len(prices))[complete]
+    res = np.repeat(np.nan, prices.size).reshape(prices.shape)
+    if len(end) > 0:
+        res[complete] = fn(start[complete], end)
+
+    if isinstance(prices, pd.DataFrame):
+        return pd.DataFrame(res, index=prices.index, columns=prices.columns)
+    return pd.Series(res, index=prices.index, name=prices.name)
+
+
+def rolling_cagr(prices, window):
+    """
+    CAGR over a trailing window ending at every date.
+
+    Windows are answered in O(1) each from prefix structures, so the cost
+    does not depend on the window length. DataFrames are processed column
+    by column at once. Dates without a complete window are NaN.
+
+    Args:
+        * prices (Series or DataFrame): prices
+        * window (int or DateOffset): number of prices in the window or
+            its length in time, e.g. pd.DateOffset(years=1)
+
+    """
+    return _rolling(prices, window,
+                    lambda i, j: _RangeStats(prices).cagr(i, j))
+
+
+def rolling_vol(prices, window):
+    """
+    Annualized volatility of daily returns over a trailing window ending at
+    every date (same as PerformanceStats.daily_vol of the window). See
+    rolling_cagr.
+    """
+    return _rolling(prices, window,
+                    lambda i, j: _RangeStats(prices).std(i, j) * np.sqrt(252))
+
+
+def rolling_sharpe(prices, window, rf=None):
+    """
+    Daily Sharpe ratio over a trailing window ending at every date (same as
+    PerformanceStats.daily_sharpe of the window). See rolling_cagr.
+
+    Args:
+        * rf (float): Annual risk-free rate. If None, the PerformanceStats
+            default is used.
+
+    """
+    if rf is None:
+        daily_rf = PerformanceStats._daily_rf
+    else:
+        daily_rf = _riskfree_rates(rf)[2]
+
+    def fn(i, j):
+        st = _RangeStats(prices)
+        return ((st.mean(i, j) * 252 - daily_rf) /
+                (st.std(i, j) * np.sqrt(252)))
+    return _rolling(prices, window, fn)
+
+
+def rolling_max_drawdown(prices, window):
+    """
+    Max drawdown over a trailing window ending at every date.
+
+    The max drawdown of a window can not be updated as the window slides,
+    so each window is answered in O(log n) from sparse tables, for all
+    windows and columns at once. See rolling_cagr.
+    """
+    return _rolling(prices, window,
+                    lambda i, j: _RangeStats(prices).max_drawdown(i, j))
+
+
+def rolling_beta(prices, benchmark, window):
+    """
+    Beta of daily returns against a benchmark over a trailing window ending
+    at every date. Computed in O(n) from cumulative sums of the returns,
+    their products and squares. Returns where either series is NaN are
+    skipped. See rolling_cagr.
+
+    Args:
+        * prices (Series or DataFrame): prices
+        * benchmark (Series): benchmark prices
+        * window (int or DateOffset): see rolling_cagr
+
+    """
+    frame = isinstance(prices, pd.DataFrame)
+    p = np.asarray(prices.values, dtype=float)
+    b = np.asarray(benchmark.reindex(prices.index).values, dtype=float)
+    if frame:
+        b = b[:, None]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = p[1:] / p[:-1] - 1
+        rb = np.broadcast_to(b[1:] / b[:-1] - 1, r.shape)
+    ok = ~np.isnan(r) & ~np.isnan(rb)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        r = np.where(ok, r - np.nanmean(np.where(ok, r, np.nan), axis=0), 0.)
+        rb = np.where(ok, rb - np.nanmean(np.where(ok, rb, np.nan), axis=0),
+                      0.)
+
+    zero = np.zeros((1,) + r.shape[1:])
+
+    def prefix(x):
+        return np.concatenate([zero, np.cumsum(x, axis=0)])
+
+    count, sr, sb = prefix(ok), prefix(r), prefix(rb)
+    srb, sbb = prefix(r * rb), prefix(rb * rb)
+
+    def fn(i, j):
+        c = count[j] - count[i]
+        r_, b_ = sr[j] - sr[i], sb[j] - sb[i]
+        cov = srb[j] - srb[i] - r_ * b_ / c
+        var = sbb[j] - sbb[i] - b_ * b_ / c
+        return np.where(c < 2, np.nan, cov / var)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return _rolling(prices, window, fn)
+
+
 def to_returns(prices):
     """
     Calculates the simple arithmetic returns of a price series.
@@ -1070,56 +1505,370 @@ def calc_max_drawdown(prices):
 
 def drawdown_details(drawdown):
     """
-    Returns a data frame with start, end, days (duration) and
-    drawdown for each drawdown in a drawdown series.
+    Returns a data frame with start, end, days (duration),
+    drawdown and trough for each drawdown in a drawdown series.
+
+    Drawdown episodes are labeled and reduced in a single vectorized pass
+    (see _drawdown_episodes), so this is linear in the length of the
+    series, for any number of series.
 
     .. note::
 
         days are actual calendar days, not trading days
 
     Args:
-        * drawdown (pandas.Series): A drawdown Series
-            (can be obtained w/ drawdown(prices).
+        * drawdown (pandas.Series or pandas.DataFrame): A drawdown Series
+            (can be obtained w/ drawdown(prices). If a DataFrame,
+            every column is treated as a drawdown series.
     Returns:
         * pandas.DataFrame -- A data frame with the following
-            columns: start, end, days, drawdown.
+            columns: start, end, days, drawdown, trough (first date at the
+            bottom of the drawdown). None if there is no drawdown.
+            For a DataFrame, a dict of such data frames (or None) by column.
 
     """
-    is_zero = drawdown == 0
-    # find start dates (first day where dd is non-zero after a zero)
-    start = ~is_zero & is_zero.shift(1)
-    start = list(start[start == True].index)  # NOQA
+    frame = isinstance(drawdown, pd.DataFrame)
+    values = np.asarray(drawdown.values, dtype=float)
+    if not frame:
+        values = values.reshape(-1, 1)
 
-    # find end dates (first day where dd is 0 after non-zero)
-    end = is_zero & (~is_zero).shift(1)
-    end = list(end[end == True].index)  # NOQA
+    column, start, end, trough, dd = _drawdown_episodes(values)
 
-    if len(start) is 0:
-        return None
+    index = drawdown.index
+    dates = index.values
+    days = (dates[end] - dates[start]).astype('timedelta64[D]').astype(int)
+    result = pd.DataFrame({'start': index[start], 'end': index[end],
+                           'days': days, 'drawdown': dd,
+                           'trough': index[trough]},
+                          columns=['start', 'end', 'days', 'drawdown',
+                                   'trough'])
 
-    # drawdown has no end (end period in dd)
-    if len(end) is 0:
-        end.append(drawdown.index[-1])
+    if not frame:
+        return result if len(result) > 0 else None
 
-    # if the first drawdown start is larger than the first drawdown end it
-    # means the drawdown series begins in a drawdown and therefore we must add
-    # the first index to the start series
-    if start[0] > end[0]:
-        start.insert(0, drawdown.index[0])
+    # episodes are ordered by column
+    bounds = np.searchsorted(column, np.arange(values.shape[1] + 1))
+    res = {}
+    for i, c in enumerate(drawdown.columns):
+        if bounds[i] == bounds[i + 1]:
+            res[c] = None
+        else:
+            res[c] = result.iloc[bounds[i]:bounds[i + 1]].reset_index(
+                drop=True)
+    return res
 
-    # if the last start is greater than the end then we must add the last index
-    # to the end series since the drawdown series must finish with a drawdown
-    if start[-1] > end[-1]:
-        end.append(drawdown.index[-1])
 
-    result = pd.DataFrame(columns=('start', 'end', 'days', 'drawdown'),
-                          index=range(0, len(start)))
+def calc_return_table(prices, monthly_prices=None):
+    """
+    Calculates the table of monthly returns of a price series: years in
+    rows, months and YTD in columns.
 
-    for i in range(0, len(start)):
-        dd = drawdown[start[i]:end[i]].min()
-        result.ix[i] = (start[i], end[i], (end[i] - start[i]).days, dd)
+    The first month's return is measured from the first price and months
+    without a return are 0. The monthly returns are placed in a
+    (years, months, series) array with a single fancy-indexed assignment,
+    so a DataFrame of prices gives the tables of all its columns at once.
 
-    return result
+    Args:
+        * prices (Series or DataFrame): daily prices
+        * monthly_prices (Series or DataFrame): month end prices
+            (prices.resample('M').last()). Calculated if None.
+
+    Returns:
+        * pandas.DataFrame -- return table. For a DataFrame of prices, a
+            dict of return tables by column.
+
+    """
+    if monthly_prices is None:
+        monthly_prices = prices.resample('M').last()
+
+    frame = isinstance(prices, pd.DataFrame)
+    p = np.asarray(prices.values, dtype=float).reshape(len(prices), -1)
+    mp = np.asarray(monthly_prices.values, dtype=float).reshape(
+        len(monthly_prices), -1)
+    dates = monthly_prices.index
+    columns = _MONTHS + ['YTD']
+
+    if len(dates) == 0:
+        if frame:
+            return dict((c, pd.DataFrame(columns=columns))
+                        for c in prices.columns)
+        return pd.DataFrame(columns=columns)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mr = np.empty_like(mp)
+        mr[1:] = mp[1:] / mp[:-1] - 1
+        # months without a return are 0
+        mr[1:][np.isnan(mr[1:])] = 0
+        # add first month
+        mr[0] = np.where(p[0] == 0, 0., mp[0] / p[0] - 1)
+
+    years = np.asarray(dates.year)
+    rows = years - years[0]
+    table = np.zeros((rows[-1] + 1, 13, mp.shape[1]))
+    table[rows, np.asarray(dates.month) - 1] = mr
+    # calculate the YTD values
+    table[:, 12] = np.prod(table[:, :12] + 1, axis=1) - 1
+
+    index = np.arange(years[0], years[-1] + 1)
+    if not frame:
+        return pd.DataFrame(table[:, :, 0], index=index, columns=columns)
+    return dict((c, pd.DataFrame(table[:, :, i], index=index,
+                                 columns=columns))
+                for i, c in enumerate(prices.columns))
+
+
+def _drawdown_episodes(drawdown):
+    """
+    Finds the drawdown episodes of each column of a 2-D array of drawdowns
+    (dates in rows) in linear time.
+
+    An episode is a run of non-zero drawdowns. It ends on the first date
+    back at zero, or on the last date if it has not recovered. Episodes are
+    labeled with a cumulative sum over start flags and reduced with
+    ufunc.reduceat, so no Python loop over dates or episodes is needed.
+
+    Args:
+        * drawdown (numpy.ndarray): drawdowns, dates x series
+
+    Returns:
+        * tuple -- (column, start, end, trough, drawdown) arrays with one
+            element per episode, ordered by column then start. start, end
+            and trough are row positions.
+
+    """
+    n, m = drawdown.shape
+    empty = np.array([], dtype=int)
+    if n == 0 or m == 0:
+        return empty, empty, empty, empty, np.array([])
+
+    # column major - episodes of a column are contiguous
+    flat = drawdown.T.ravel()
+    in_dd = ~(flat == 0)
+    prev = np.empty_like(in_dd)
+    prev[1:] = in_dd[:-1]
+    # the first date of a column never continues an episode
+    prev[::n] = False
+
+    pos = np.flatnonzero(in_dd)
+    if len(pos) == 0:
+        return empty, empty, empty, empty, np.array([])
+
+    values = flat[pos]
+    first = in_dd[pos] & ~prev[pos]
+    bounds = np.flatnonzero(first)
+    label = np.cumsum(first) - 1
+    lengths = np.diff(np.append(bounds, len(pos)))
+
+    column = pos[bounds] // n
+    start = pos[bounds] % n
+    last = start + lengths - 1
+    recovered = last + 1 < n
+    end = np.where(recovered, last + 1, last)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        dd = np.fmin.reduceat(values, bounds)
+        # first date of each episode at its minimum
+        at_min = np.where(values == dd[label], np.arange(len(pos)), len(pos))
+        trough = np.minimum.reduceat(at_min, bounds)
+
+    # all-NaN episodes have no minimum
+    trough = np.where(trough < len(pos),
+                      pos[np.minimum(trough, len(pos) - 1)] % n, start)
+    # recovered episodes include their (zero) end date
+    dd = np.where(recovered, np.fmin(dd, 0.), dd)
+
+    return column, start, end, trough, dd
+
+
+def calc_group_stats(prices, rf=None):
+    """
+    Calculates the PerformanceStats statistics of all columns of a
+    DataFrame of prices at once.
+
+    Instead of building one PerformanceStats per column, every statistic is
+    computed for all columns together with 2-D NumPy operations. This is
+    what makes GroupStats of hundreds of series (sweeps, random benchmarks)
+    cheap. The results match PerformanceStats for NaN-free prices sharing
+    one index, which is what GroupStats provides.
+
+    Args:
+        * prices (DataFrame): NaN-free prices, series in columns
+        * rf (float): Annual risk-free rate. If None, the PerformanceStats
+            default is used.
+
+    Returns:
+        * pandas.DataFrame -- stats in rows (same rows as
+            PerformanceStats.stats), series in columns.
+
+    """
+    if rf is None:
+        rates = (PerformanceStats._yearly_rf, PerformanceStats._monthly_rf,
+                 PerformanceStats._daily_rf)
+    else:
+        rates = _riskfree_rates(rf)
+
+    m = prices.shape[1]
+    res = dict((k, np.repeat(np.nan, m)) for k in _STAT_KEYS)
+    res['_yearly_rf'][:] = rates[0]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            _calc_group_stats(prices, res, *rates)
+
+    table = np.empty((len(_STAT_KEYS), m), dtype=object)
+    for i, k in enumerate(_STAT_KEYS):
+        table[i] = res[k]
+
+    return pd.DataFrame(table, index=_STAT_KEYS, columns=prices.columns)
+
+
+def _calc_group_stats(prices, res, yearly_rf, monthly_rf, daily_rf):
+    # mirrors PerformanceStats._calculate - stats not reached keep NaN
+    n, m = prices.shape
+    if n == 0:
+        return
+
+    idx = prices.index
+    p = prices.values.astype(float)
+
+    res['start'] = np.array([idx[0]] * m, dtype=object)
+    res['end'] = np.array([idx[-1]] * m, dtype=object)
+
+    if n == 1:
+        return
+
+    def skew(x):
+        return pd.DataFrame(x).skew().values
+
+    def kurt(x):
+        # if all zero/nan kurt fails division by zero
+        ok = ((~np.isnan(x)) & (x != 0)).any(axis=0)
+        return np.where(ok, pd.DataFrame(x).kurt().values, np.nan)
+
+    def since(offset):
+        # return from the last price on or before offset from the end
+        pos = idx.searchsorted(idx[-1] - offset, side='right') - 1
+        if pos < 0:
+            return np.repeat(np.nan, m)
+        return p[-1] / p[pos] - 1
+
+    def cagr(offset=None):
+        # cagr from the first price on or after offset from the end
+        pos = 0
+        if offset is not None:
+            pos = idx.searchsorted(idx[-1] - offset, side='left')
+        frac = year_frac(idx[pos], idx[-1])
+        if frac == 0:
+            return np.repeat(np.nan, m)
+        return (p[-1] / p[pos]) ** (1. / frac) - 1
+
+    def returns(x):
+        r = np.empty_like(x)
+        r[0] = np.nan
+        r[1:] = x[1:] / x[:-1] - 1
+        return r
+
+    # stats using daily data
+    r = p[1:] / p[:-1] - 1
+
+    res['daily_mean'] = np.nanmean(r, axis=0) * 252
+    res['daily_vol'] = np.nanstd(r, axis=0, ddof=1) * np.sqrt(252)
+    res['daily_sharpe'] = (res['daily_mean'] - daily_rf) / res['daily_vol']
+    res['best_day'] = np.nanmax(r, axis=0)
+    res['worst_day'] = np.nanmin(r, axis=0)
+
+    res['total_return'] = p[-1] / p[0] - 1
+    res['ytd'] = res['total_return']
+    res['cagr'] = cagr()
+    res['incep'] = res['cagr']
+
+    dd = p / np.maximum.accumulate(p, axis=0) - 1.
+    res['max_drawdown'] = np.nanmin(dd, axis=0)
+    col, start, end, _, dd_min = _drawdown_episodes(dd)
+    if len(col) > 0:
+        count = np.bincount(col, minlength=m).astype(float)
+        days = ((idx.values[end] - idx.values[start]).astype(
+            'timedelta64[D]').astype(float))
+        res['avg_drawdown'] = np.bincount(col, dd_min, minlength=m) / count
+        res['avg_drawdown_days'] = np.bincount(col, days, minlength=m) / count
+
+    if n < 4:
+        return
+
+    res['daily_skew'] = skew(r)
+    res['daily_kurt'] = kurt(r)
+
+    # stats using monthly data
+    mp = prices.resample('M').last().values.astype(float)
+    mr = returns(mp)
+    k = len(mr)
+
+    if k < 2:
+        return
+
+    res['monthly_mean'] = np.nanmean(mr, axis=0) * 12
+    res['monthly_vol'] = np.nanstd(mr, axis=0, ddof=1) * np.sqrt(12)
+    res['monthly_sharpe'] = ((res['monthly_mean'] - monthly_rf) /
+                             res['monthly_vol'])
+    res['best_month'] = np.nanmax(mr, axis=0)
+    res['worst_month'] = np.nanmin(mr, axis=0)
+
+    # -2 because p[-1] will be mp[-1]
+    res['mtd'] = p[-1] / mp[-2] - 1
+
+    # -1 here to account for first return that will be nan
+    res['pos_month_perc'] = (mr > 0).sum(axis=0) / float(k - 1)
+    res['avg_up_month'] = np.nanmean(np.where(mr > 0, mr, np.nan), axis=0)
+    res['avg_down_month'] = np.nanmean(np.where(mr <= 0, mr, np.nan), axis=0)
+
+    if k < 3:
+        return
+
+    res['three_month'] = since(pd.DateOffset(months=3))
+
+    if k < 4:
+        return
+
+    res['monthly_skew'] = skew(mr)
+    res['monthly_kurt'] = kurt(mr)
+    res['six_month'] = since(pd.DateOffset(months=6))
+
+    yp = prices.resample('A').last().values.astype(float)
+    yr = returns(yp)
+    ky = len(yr)
+
+    if ky < 2:
+        return
+
+    res['ytd'] = p[-1] / yp[-2] - 1
+    res['one_year'] = since(pd.DateOffset(years=1))
+
+    res['yearly_mean'] = np.nanmean(yr, axis=0)
+    res['yearly_vol'] = np.nanstd(yr, axis=0, ddof=1)
+    res['yearly_sharpe'] = (res['yearly_mean'] - yearly_rf) / res['yearly_vol']
+    res['best_year'] = np.nanmax(yr, axis=0)
+    res['worst_year'] = np.nanmin(yr, axis=0)
+
+    # annualize stat for over 1 year
+    res['three_year'] = cagr(pd.DateOffset(years=3))
+
+    # -1 here to account for first return that will be nan
+    res['win_year_perc'] = (yr > 0).sum(axis=0) / float(ky - 1)
+
+    if k > 11:
+        res['twelve_month_win_perc'] = ((mp[11:] / mp[:-11] > 1).sum(axis=0) /
+                                        float(k - 11))
+
+    if ky < 4:
+        return
+
+    res['yearly_skew'] = skew(yr)
+    res['yearly_kurt'] = kurt(yr)
+
+    res['five_year'] = cagr(pd.DateOffset(years=5))
+    res['ten_year'] = cagr(pd.DateOffset(years=10))
 
 
 def calc_cagr(prices):
@@ -1700,7 +2449,7 @@ def plot_corr_heatmap(data, **kwargs):
     return plot_heatmap(data.corr(), vmin=-1, vmax=1, **kwargs)
 
 
-def rollapply(data, window, fn):
+def rollapply(data, window, fn, raw=False, batch=False, n_jobs=1):
     """
     Apply a function fn over a rolling window of size window.
 
@@ -1710,6 +2459,18 @@ def rollapply(data, window, fn):
         * fn (function): Function to apply over the rolling window.
             For a series, the return value is expected to be a single
             number. For a DataFrame, it shuold return a new row.
+        * raw (bool): If True, fn receives NumPy arrays instead of pandas
+            objects - a 1-D array for a Series, a (window x columns) array
+            for a DataFrame. Windows are read-only strided views of the
+            data, nothing is copied.
+        * batch (bool): If True, fn is called once with all the windows
+            as a single read-only strided view (windows x window [x
+            columns]) and returns a value (Series) or row (DataFrame) per
+            window. Implies raw.
+        * n_jobs (int): Number of worker processes (-1 for all cpus). The
+            windows are split in contiguous chunks, processed in parallel.
+            Workers are forked where possible, so fn does not need to be
+            picklable there.
 
     Returns:
         * Object of same dimensions as data
@@ -1721,52 +2482,187 @@ def rollapply(data, window, fn):
     if window > n:
         return res
 
-    for i in range(window - 1, n):
-        res.iloc[i] = fn(data.iloc[i - window + 1:i + 1])
+    raw = raw or batch
+    state = {'data': data.values if raw else data, 'window': window,
+             'fn': fn, 'raw': raw, 'batch': batch}
+
+    if n_jobs is None or n_jobs < 0:
+        n_jobs = multiprocessing.cpu_count()
+    n_jobs = min(n_jobs, n - window + 1)
+
+    if n_jobs <= 1:
+        out = _rollapply_range(state, window - 1, n)
+    else:
+        chunks = np.array_split(np.arange(window - 1, n), n_jobs * 4)
+        tasks = [(c[0], c[-1] + 1) for c in chunks if len(c) > 0]
+        try:
+            ctx = multiprocessing.get_context('fork')
+        except (AttributeError, ValueError):
+            ctx = multiprocessing
+        pool = ctx.Pool(n_jobs, initializer=_init_rollapply,
+                        initargs=(state,))
+        try:
+            outs = pool.map(_rollapply_chunk, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+        if batch:
+            out = np.concatenate([np.asarray(o) for o in outs])
+        else:
+            out = [x for o in outs for x in o]
+
+    if isinstance(data, pd.DataFrame) and not batch and \
+            isinstance(out[0], pd.Series):
+        # rows are aligned on the columns
+        out = pd.DataFrame(out).reindex(columns=data.columns).values
+    res.iloc[window - 1:] = np.asarray(out)
 
     return res
 
 
-def _winsorize_wrapper(x, limits):
+# state of rollapply worker processes
+_ROLLAPPLY = {}
+
+
+def _init_rollapply(state):
+    _ROLLAPPLY.clear()
+    _ROLLAPPLY.update(state)
+
+
+def _rollapply_chunk(bounds):
+    return _rollapply_range(_ROLLAPPLY, *bounds)
+
+
+def _rollapply_range(state, start, end):
+    # fn applied to the windows ending at positions start..end - 1
+    data, window, fn = state['data'], state['window'], state['fn']
+
+    if not state['raw']:
+        return [fn(data.iloc[i - window + 1:i + 1])
+                for i in range(start, end)]
+
+    windows = _strided_windows(data[start - window + 1:end], window)
+    if state['batch']:
+        return fn(windows)
+    return [fn(w) for w in windows]
+
+
+def _strided_windows(values, window):
+    """
+    Read-only view of all windows of length window over the first axis of
+    values: shape (len(values) - window + 1, window) + values.shape[1:].
     """
-    Wraps scipy winsorize function to drop na's
+    shape = (values.shape[0] - window + 1, window) + values.shape[1:]
+    strides = (values.strides[0],) + values.strides
+    return np.lib.stride_tricks.as_strided(values, shape=shape,
+                                           strides=strides, writeable=False)
+
+
+def _grouped(x, axis, groups, fn):
     """
-    if hasattr(x, 'dropna'):
-        if len(x.dropna()) == 0:
-            return x
+    Applies fn(values, axis) to the values of x, separately for each group
+    of entries along axis (the entries fn reduces over) if groups is given.
+    Entries without a group are left as they are.
+    """
+    frame = isinstance(x, pd.DataFrame)
+    values = np.array(x.values, dtype=float)
+    if not frame:
+        values = values.reshape(-1, 1)
+        axis = 0
+
+    if groups is None:
+        res = fn(values, axis)
+    else:
+        labels = x.index if axis == 0 else x.columns
+        if isinstance(groups, (pd.Series, dict)):
+            groups = pd.Series(groups).reindex(labels)
+        groups = np.asarray(groups)
+        res = values.copy()
+        for g in pd.unique(groups[pd.notnull(groups)]):
+            mask = groups == g
+            if axis == 0:
+                res[mask] = fn(values[mask], 0)
+            else:
+                res[:, mask] = fn(values[:, mask], 1)
+
+    if frame:
+        return pd.DataFrame(res, index=x.index, columns=x.columns)
+    return pd.Series(res[:, 0], index=x.index, name=x.name)
+
 
-        x[~np.isnan(x)] = scipy.stats.mstats.winsorize(x[~np.isnan(x)],
-                                                       limits=limits)
-        return x
+def _winsorize_values(values, axis, limits):
+    # same clipping as scipy.stats.mstats.winsorize, on the non-NaN values
+    # of every column (axis=0) or row (axis=1) at once
+    if isinstance(limits, (tuple, list)):
+        low, high = limits
     else:
-        return scipy.stats.mstats.winsorize(x, limits=limits)
+        low = high = limits
+
+    a = values if axis == 0 else values.T
+    n = a.shape[0]
+    if n == 0:
+        return values
+
+    # NaNs are sorted last
+    srt = np.sort(a, axis=0)
+    count = (~np.isnan(a)).sum(axis=0)
+    cols = np.arange(a.shape[1])
+
+    with np.errstate(invalid='ignore'):
+        if low:
+            lo = srt[np.minimum((low * count).astype(int), n - 1), cols]
+            a = np.where(a < lo, lo, a)
+        if high:
+            hi = srt[np.maximum(count - (high * count).astype(int) - 1, 0),
+                     cols]
+            a = np.where(a > hi, hi, a)
+
+    return a if axis == 0 else a.T
 
 
-def winsorize(x, axis=0, limits=0.01):
+def winsorize(x, axis=0, limits=0.01, groups=None):
     """
     Winsorize values based on limits
-    """
-    # operate on copy
-    x = x.copy()
 
-    if isinstance(x, pd.DataFrame):
-        return x.apply(_winsorize_wrapper, axis=axis, args=(limits, ))
-    else:
-        return pd.Series(_winsorize_wrapper(x, limits).values,
-                         index=x.index)
+    The lowest (highest) fraction of the non-NaN values of each column
+    (axis=0) or row (axis=1) are set to the lowest (highest) remaining
+    value, as scipy.stats.mstats.winsorize does. NaNs are kept. All
+    columns or rows are processed at once from a single sort.
+
+    Args:
+        * x (Series or DataFrame): values
+        * axis (int): 0 to winsorize each column, 1 each row
+        * limits (float or (low, high)): fraction of values clipped at
+            each end. None for an end that is not clipped.
+        * groups (Series, dict or array): group of each entry along axis,
+            e.g. the sector of each ticker (columns) with axis=1. Values
+            are winsorized within their group. Series and dicts are
+            matched by label, arrays by position.
+
+    """
+    return _grouped(x, axis, groups,
+                    lambda v, ax: _winsorize_values(v, ax, limits))
 
 
-def rescale(x, min=0., max=1., axis=0):
+def rescale(x, min=0., max=1., axis=0, groups=None):
     """
     Rescale values to fit a certain range [min, max]
+
+    Each column (axis=0) or row (axis=1) is rescaled linearly from its own
+    NaN-ignoring [min, max] range, all at once. NaNs are kept. See
+    winsorize for groups.
     """
-    def innerfn(x, min, max):
-        return np.interp(x, [np.min(x), np.max(x)], [min, max])
+    def fn(values, ax):
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            lo = np.nanmin(values, axis=ax, keepdims=True)
+            hi = np.nanmax(values, axis=ax, keepdims=True)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            res = min + (values - lo) / (hi - lo) * (max - min)
+        # constant values map to max, like np.interp
+        return np.where((hi == lo) & ~np.isnan(values), max, res)
 
-    if isinstance(x, pd.DataFrame):
-        return x.apply(innerfn, axis=axis, args=(min, max,))
-    else:
-        return pd.Series(innerfn(x, min, max), index=x.index)
+    return _grouped(x, axis, groups, fn)
 
 
 def annualize(returns, durations, one_year=365.):
@@ -1799,6 +2695,11 @@ def extend_pandas():
     PandasObject.calc_perf_stats = calc_perf_stats
     PandasObject.to_drawdown_series = to_drawdown_series
     PandasObject.calc_max_drawdown = calc_max_drawdown
+    PandasObject.rolling_cagr = rolling_cagr
+    PandasObject.rolling_vol = rolling_vol
+    PandasObject.rolling_sharpe = rolling_sharpe
+    PandasObject.rolling_max_drawdown = rolling_max_drawdown
+    PandasObject.rolling_beta = rolling_beta
     PandasObject.calc_cagr = calc_cagr
     PandasObject.calc_total_return = calc_total_return
     PandasObject.as_percent = utils.as_percent
@@ -0,0 +1,171 @@
+"""
+
+"""
+from __future__ import division
+from timeit import default_timer
+import pandas as pd
+
+__author__ = 'Seung Hyeon Yu'
+__email__ = 'rambor12@business.kaist.ac.kr'
+
+
+def algo_name(algo):
+    """
+    Name used to report an Algo. Plain functions are reported by their
+    function name.
+    """
+    name = getattr(algo, 'name', None)
+    if name is None:
+        name = getattr(algo, '__name__', algo.__class__.__name__)
+    return name
+
+
+class AlgoProfiler(object):
+
+    """
+    Collects call counts and wall times of the Algos run in a Strategy tree.
+
+    A profiler is attached to the root strategy (Backtest does this when
+    created with profile=True). While attached, every AlgoStack call and
+    every Strategy.run is routed through it. When no profiler is attached,
+    the only overhead is a single attribute check per call.
+
+    Algos are keyed by the strategy they ran on and their name. Algos run
+    inside nested stacks (SelectMomentum for example) are keyed by their
+    path, e.g. 'SelectMomentum>StatTotalReturn'. Strategy.run itself is
+    recorded under the '(run)' key and includes the time spent running
+    the strategy's children.
+
+    Attributes:
+        * records (dict): {(strategy, algo): [calls, passed, failed,
+            total time, max time]}
+        * stats (DataFrame): records as a DataFrame, slowest first
+
+    """
+
+    RUN_KEY = '(run)'
+
+    def __init__(self):
+        self.records = {}
+        self._path = []
+
+    def call(self, algo, target):
+        """
+        Call algo on target and record the outcome.
+        """
+        self._path.append(algo_name(algo))
+        key = (target.full_name, '>'.join(self._path))
+        start = default_timer()
+        try:
+            res = algo(target)
+        finally:
+            elapsed = default_timer() - start
+            self._path.pop()
+
+        self._record(key, res, elapsed)
+        return res
+
+    def run(self, strategy):
+        """
+        Run strategy and record the outcome of its algo stack.
+        """
+        # each strategy starts with a fresh path - children are run
+        # after the parent's stack has returned
+        path = self._path
+        self._path = []
+        start = default_timer()
+        try:
+            res = strategy._run()
+        finally:
+            elapsed = default_timer() - start
+            self._path = path
+
+        self._record((strategy.full_name, self.RUN_KEY), res, elapsed)
+        return res
+
+    def _record(self, key, res, elapsed):
+        rec = self.records.get(key)
+        if rec is None:
+            rec = [0, 0, 0, 0., 0.]
+            self.records[key] = rec
+
+        rec[0] += 1
+        if res:
+            rec[1] += 1
+        else:
+            rec[2] += 1
+        rec[3] += elapsed
+        if elapsed > rec[4]:
+            rec[4] = elapsed
+
+    def reset(self):
+        """
+        Clear all records.
+        """
+        self.records = {}
+        self._path = []
+
+    @property
+    def stats(self):
+        """
+        DataFrame of calls, passes, failures, total, mean and max wall time
+        (seconds) by strategy and algo, sorted by total time.
+        """
+        columns = ['calls', 'passed', 'failed', 'total', 'mean', 'max']
+        if len(self.records) == 0:
+            return pd.DataFrame(columns=columns)
+
+        keys = list(self.records.keys())
+        rows = []
+        for k in keys:
+            calls, passed, failed, total, mx = self.records[k]
+            rows.append([calls, passed, failed, total, total / calls, mx])
+
+        res = pd.DataFrame(rows, columns=columns,
+                           index=pd.MultiIndex.from_tuples(
+                               keys, names=['strategy', 'algo']))
+        return res.sort_values('total', ascending=False)
+
+
+class EngineCounters(dict):
+
+    """
+    Counts hot-path operations of the node tree during a backtest.
+
+    Counters are attached to the root strategy (Backtest does this when
+    created with engine_counters=True) and incremented by StrategyBase and
+    SecurityBase. When no counters are attached, the only overhead is a
+    single attribute check per operation.
+
+    Updates are split into new-date updates and stale refreshes (same-date
+    updates, usually triggered by accessing value/weight/price on a stale
+    root after an allocation). Security updates that return immediately
+    because nothing changed are counted as skipped.
+
+    Attributes:
+        * stats (Series): counters in a fixed order
+
+    """
+
+    KEYS = ('strategy_update_new', 'strategy_update_stale',
+            'security_update_new', 'security_update_stale',
+            'security_update_skipped', 'get_loc',
+            'strategy_allocate', 'security_allocate', 'adjust',
+            'commission', 'security_created')
+
+    def __init__(self):
+        super(EngineCounters, self).__init__((k, 0) for k in self.KEYS)
+
+    def reset(self):
+        """
+        Set all counters back to zero.
+        """
+        for k in self.KEYS:
+            self[k] = 0
+
+    @property
+    def stats(self):
+        """
+        Series of counters.
+        """
+        return pd.Series([self[k] for k in self.KEYS], index=self.KEYS)
@@ -0,0 +1,504 @@
+"""
+
+"""
+from __future__ import division
+from functools import partial
+from itertools import product
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import numpy as np
+import pandas as pd
+import KSIF.core.ffn as ffn
+from KSIF.core.backtest import Backtest, to_float32
+from KSIF.core.base import PanelCache
+
+__author__ = 'Seung Hyeon Yu'
+__email__ = 'rambor12@business.kaist.ac.kr'
+
+
+# backends of sweep and walk_forward
+BACKENDS = ('process', 'thread')
+
+
+def sweep(factory, data, grid, n_jobs=1, backend='process', keep=False,
+          cache=None, **kwargs):
+    """
+    Runs a strategy over a grid of parameters and returns a SweepResult.
+
+    The universe is shared by every backtest and panels that algos can
+    precompute (see PanelCache and Algo.precompute) are computed once
+    before the workers start - total returns for each distinct
+    lookback/lag, for example, are computed once for the whole grid.
+
+    Only the price series of each backtest is kept unless keep is True,
+    so memory stays bounded on large grids.
+
+    Ex:
+        def factory(n, lookback):
+            return kf.Strategy('mom', [kf.algos.RunMonthly(),
+                                       kf.algos.SelectAll(),
+                                       kf.algos.SelectMomentum(
+                                           n=n, lookback=lookback),
+                                       kf.algos.WeighEqually(),
+                                       kf.algos.Rebalance()])
+
+        res = kf.sweep(factory, data,
+                       {'n': [5, 10, 20],
+                        'lookback': [pd.DateOffset(months=m)
+                                     for m in (1, 3, 6)]},
+                       n_jobs=4)
+        res.table
+
+    Args:
+        * factory (fn(**params)): Function returning a Strategy given a set
+            of parameters.
+        * data (DataFrame): Universe shared by all backtests.
+        * grid (dict, list): Either a dict {param: [values]}, in which case
+            every combination is run, or a list of {param: value} dicts.
+        * n_jobs (int): Number of workers. 1 runs in the current process.
+            None or -1 uses all cpus.
+        * backend (str): 'process' or 'thread'. Backtests are CPU bound
+            python code so processes are usually faster. With processes,
+            factory must be picklable on platforms without fork (Windows).
+        * keep (bool): Keep full Backtest objects (strategy trees) in the
+            result. With the process backend, whole trees are pickled back
+            from the workers.
+        * cache (PanelCache): Precomputed panels for data. Created if None.
+        * kwargs: passed to Backtest (initial_capital, commissions, ...)
+
+    Returns:
+        SweepResult
+
+    """
+    _check_backend(backend)
+
+    params = expand_grid(grid)
+    if len(params) == 0:
+        raise ValueError('grid is empty')
+
+    labels = [param_label(p) for p in params]
+    if len(set(labels)) != len(labels):
+        raise ValueError('grid contains duplicate parameter sets')
+
+    # convert once so that every backtest shares the float32 universe
+    if kwargs.get('float32'):
+        data = to_float32(data)
+
+    if cache is None:
+        cache = PanelCache(data)
+    elif cache.data is not data:
+        raise ValueError('cache was built for a different data set')
+
+    # precompute shared panels once, before workers are forked
+    for p in params:
+        precompute(factory(**p), cache)
+
+    kwargs['progress_bar'] = False
+    tasks = [(label, p, None) for label, p in zip(labels, params)]
+    results = _map(_run_task, tasks, (factory, {None: cache}, kwargs, keep),
+                   n_jobs, backend)
+
+    return SweepResult(labels, params, results, keep=keep)
+
+
+def expand_grid(grid):
+    """
+    Expand a parameter grid into a list of {param: value} dicts.
+
+    Args:
+        * grid (dict, list): {param: [values]} or a list of dicts. Dict
+            params are expanded in sorted key order.
+
+    """
+    if isinstance(grid, dict):
+        keys = sorted(grid)
+        return [dict(zip(keys, vals))
+                for vals in product(*[grid[k] for k in keys])]
+    return [dict(p) for p in grid]
+
+
+def param_label(params):
+    """
+    Label used to name the backtest of a parameter set, e.g.
+    'lookback=3months,n=10'.
+    """
+    return ','.join('%s=%s' % (k, _fmt_param(params[k]))
+                    for k in sorted(params))
+
+
+def _fmt_param(value):
+    if isinstance(value, pd.DateOffset):
+        kwds = getattr(value, 'kwds', None)
+        if kwds:
+            return '+'.join('%s%s' % (v, k) for k, v in sorted(kwds.items()))
+        return value.freqstr
+    return str(value)
+
+
+def precompute(strategy, cache):
+    """
+    Call the precompute hook of every algo in a strategy tree.
+    """
+    stack = getattr(strategy, 'stack', None)
+    if stack is not None and hasattr(stack, 'precompute'):
+        stack.precompute(cache)
+    for c in strategy._childrenv:
+        precompute(c, cache)
+
+
+# state shared by tasks of a worker process - set once per process by
+# _init_worker. Serial and thread runs pass it to tasks directly instead.
+_WORKER = {}
+
+
+def _init_worker(state):
+    _WORKER['state'] = state
+
+
+def _run_task(task, state=None):
+    # caches are keyed by data slice - the backtest runs on cache.data
+    if state is None:
+        state = _WORKER['state']
+    factory, caches, kwargs, keep = state
+    label, params, key = task
+    cache = caches[key]
+
+    strategy = factory(**params)
+    strategy.name = label
+    bkt = Backtest(strategy, cache.data, name=label, cache=cache, **kwargs)
+    bkt.run()
+
+    if keep:
+        return bkt
+    # copy so the strategy tree can be garbage collected
+    return bkt.strategy.prices.copy()
+
+
+def _check_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError('backend must be one of %s, got %r'
+                         % (', '.join(BACKENDS), backend))
+
+
+def _map(fn, tasks, state, n_jobs=1, backend='process'):
+    """
+    Map fn over tasks, with state passed to fn as its state argument, or
+    through _WORKER in worker processes. Results are returned in task order.
+    """
+    _check_backend(backend)
+    if n_jobs is None or n_jobs < 0:
+        n_jobs = multiprocessing.cpu_count()
+
+    if n_jobs == 1 or len(tasks) == 1:
+        return [fn(t, state=state) for t in tasks]
+
+    n_jobs = min(n_jobs, len(tasks))
+    if backend == 'thread':
+        # threads share the caller's memory - no global state needed, so
+        # concurrent sweeps don't overwrite each other's state
+        fn = partial(fn, state=state)
+        pool = ThreadPool(n_jobs)
+    else:
+        # process - fork shares data and precomputed panels with the
+        # workers without pickling them
+        try:
+            ctx = multiprocessing.get_context('fork')
+        except (AttributeError, ValueError):
+            ctx = multiprocessing
+        pool = ctx.Pool(n_jobs, initializer=_init_worker, initargs=(state,))
+
+    try:
+        return pool.map(fn, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+class SweepResult(ffn.GroupStats):
+    """
+    GroupStats of a parameter sweep. Each series is named by its parameter
+    label (see param_label).
+
+    Args:
+        * labels (list): Parameter labels
+        * params (list): Parameter dicts in the same order
+        * results (list): Price series (or Backtests if keep) in the same
+            order
+        * keep (bool): results are Backtests
+
+    Attributes:
+        * params (DataFrame): Parameters by label
+        * table (DataFrame): Parameters and stats, one row per label
+        * backtests (dict): Backtests by label, empty unless keep
+
+    """
+
+    def __init__(self, labels, params, results, keep=False):
+        if keep:
+            self.backtests = dict(zip(labels, results))
+            prices = [pd.DataFrame({k: b.strategy.prices})
+                      for k, b in zip(labels, results)]
+        else:
+            self.backtests = {}
+            prices = [pd.DataFrame({k: p}) for k, p in zip(labels, results)]
+
+        super(SweepResult, self).__init__(*prices)
+        self.params = pd.DataFrame(params, index=labels)
+        self._param_sets = dict(zip(labels, params))
+
+    @property
+    def table(self):
+        """
+        DataFrame with one row per parameter set: parameters followed by
+        stats.
+        """
+        return pd.concat([self.params, self.stats.T], axis=1)
+
+    def best(self, metric='daily_sharpe', ascending=False):
+        """
+        Parameter dict of the best parameter set given a stat.
+
+        Args:
+            * metric (str): Any stat in self.stats
+            * ascending (bool): Lower is better (max_drawdown is negative
+                so it is also higher is better)
+
+        """
+        ser = self.stats.loc[metric].astype(float).dropna()
+        if len(ser) == 0:
+            raise ValueError('%s is not available for any parameter set'
+                             % metric)
+        ser = ser.sort_values(ascending=ascending)
+        return dict(self._param_sets[ser.index[0]])
+
+
+def walk_forward(factory, data, grid, train, test, mode='rolling',
+                 metric='daily_sharpe', ascending=False, reuse=True,
+                 n_jobs=1, backend='process', name='walk_forward',
+                 **kwargs):
+    """
+    Walk-forward optimization.
+
+    The dates are split into consecutive train/test windows. On each train
+    window every parameter set of the grid is backtested and the best one,
+    according to a PerformanceStats metric, is kept for the following test
+    window. The out-of-sample test segments are stitched into a single
+    equity curve.
+
+    Test segments are taken from a backtest started at the beginning of
+    the train window, so the strategy has the train window as warm-up
+    history. Its first out-of-sample return is the return on the first
+    test date of positions chosen on the last train date.
+
+    With reuse (the default), each (window, parameter set) is backtested
+    once over train + test: the train metric is computed on the train part
+    and the test segment is read from the same run. In expanding mode all
+    windows start on the first date, so a single run per parameter set over
+    the whole period serves every window. This relies on the strategy only
+    looking at past data (which is the case for the algos in this library).
+    Set reuse to False for strategies that peek ahead - train windows are
+    then run separately and the chosen parameter sets are run again over
+    train + test.
+
+    All independent runs are executed concurrently (see sweep for n_jobs
+    and backend).
+
+    Args:
+        * factory (fn(**params)): Function returning a Strategy given a set
+            of parameters.
+        * data (DataFrame): Universe.
+        * grid (dict, list): Parameter grid (see sweep).
+        * train (int, DateOffset): Train window length - number of dates
+            or a DateOffset.
+        * test (int, DateOffset): Test window length, which is also the
+            step between windows.
+        * mode (str): 'rolling' (fixed length train windows) or 'expanding'
+            (train windows all start on the first date).
+        * metric (str): PerformanceStats attribute used to pick parameters.
+        * ascending (bool): Lower metric is better.
+        * reuse (bool): Reuse train runs for the test segments (see above).
+        * n_jobs (int): Number of workers.
+        * backend (str): 'process' or 'thread'.
+        * name (str): Name of the stitched series.
+        * kwargs: passed to Backtest
+
+    Returns:
+        WalkForwardResult
+
+    """
+    if mode not in ('rolling', 'expanding'):
+        raise ValueError('mode must be rolling or expanding')
+    _check_backend(backend)
+
+    params = expand_grid(grid)
+    if len(params) == 0:
+        raise ValueError('grid is empty')
+    labels = [param_label(p) for p in params]
+
+    windows = split_windows(data.index, train, test, mode)
+    if len(windows) == 0:
+        raise ValueError('not enough data for one train/test window')
+
+    kwargs['progress_bar'] = False
+    if kwargs.get('float32'):
+        data = to_float32(data)
+
+    # slice to run for each window: train + test with reuse, train only
+    # otherwise. Windows sharing a slice share its runs.
+    if not reuse:
+        run_of = [(ts, te) for ts, te, _, _ in windows]
+    elif mode == 'expanding':
+        run_of = [(0, windows[-1][3]) for _ in windows]
+    else:
+        run_of = [(ts, oe) for ts, _, _, oe in windows]
+
+    runs = _run_slices(factory, data, set(run_of), labels, params, kwargs,
+                       n_jobs, backend)
+
+    # pick best parameters on each train window
+    picks = []
+    for (ts, te, os_, oe), key in zip(windows, run_of):
+        scores = []
+        for label in labels:
+            prc = runs[key, label]
+            # prices start at the slice start
+            prc = prc.iloc[ts - key[0]:te - key[0]]
+            scores.append(getattr(prc.calc_perf_stats(), metric))
+        scores = pd.Series(scores, index=labels).astype(float).dropna()
+        if len(scores) == 0:
+            raise ValueError('%s is not available on train window %s - %s'
+                             % (metric, data.index[ts], data.index[te - 1]))
+        best = scores.sort_values(ascending=ascending).index[0]
+        picks.append((best, scores[best]))
+
+    # test segments - run again unless train runs already cover them
+    if reuse:
+        test_of = run_of
+    else:
+        test_of = [(ts, oe) for ts, _, _, oe in windows]
+        needed = set(zip(test_of, [b for b, _ in picks]))
+        extra = _run_slices(factory, data, set(test_of), labels, params,
+                            kwargs, n_jobs, backend, only=needed)
+        runs.update(extra)
+
+    rets = []
+    rows = []
+    for (ts, te, os_, oe), key, (best, score) in zip(windows, test_of, picks):
+        prc = runs[key, best]
+        # include the last train date to get the first test date return
+        seg = prc.iloc[os_ - 1 - key[0]:oe - key[0]]
+        rets.append(seg.to_returns().iloc[1:])
+        rows.append([data.index[ts], data.index[te - 1], data.index[os_],
+                     data.index[oe - 1], best, score,
+                     seg.iloc[-1] / seg.iloc[0] - 1])
+
+    rets = pd.concat(rets)
+    # start the stitched curve on the last date of the first train window
+    first = pd.Series([0.], index=[data.index[windows[0][2] - 1]])
+    prices = pd.concat([first, rets]).to_price_index()
+    prices.name = name
+
+    table = pd.DataFrame(rows, columns=['train_start', 'train_end',
+                                        'test_start', 'test_end', 'params',
+                                        metric, 'test_return'])
+    return WalkForwardResult(prices, table,
+                             dict(zip(labels, params)))
+
+
+def split_windows(index, train, test, mode='rolling'):
+    """
+    Split a date index into train/test windows.
+
+    Args:
+        * index (DatetimeIndex): Dates
+        * train (int, DateOffset): Train window length
+        * test (int, DateOffset): Test window length and step
+        * mode (str): 'rolling' or 'expanding'
+
+    Returns:
+        list of (train_start, train_end, test_start, test_end) integer
+        positions, ends excluded. The last test window may be shorter.
+
+    """
+    n = len(index)
+    windows = []
+    te = _advance(index, 0, train)
+    while te < n:
+        if mode == 'expanding':
+            ts = 0
+        else:
+            ts = _back(index, te, train)
+        oe = _advance(index, te, test)
+        # need two dates to compute a train return
+        if te - ts < 2 or oe <= te:
+            break
+        windows.append((ts, te, te, oe))
+        te = oe
+    return windows
+
+
+def _advance(index, pos, length):
+    # position length after pos
+    if isinstance(length, (int, np.integer)):
+        return min(pos + length, len(index))
+    return int(index.searchsorted(index[pos] + length, side='left'))
+
+
+def _back(index, pos, length):
+    # position length before pos
+    if isinstance(length, (int, np.integer)):
+        return max(pos - length, 0)
+    return int(index.searchsorted(index[pos] - length, side='left'))
+
+
+def _run_slices(factory, data, slices, labels, params, kwargs,
+                n_jobs=1, backend='process', only=None):
+    """
+    Run every parameter set on each (start, end) slice of data. Each slice
+    gets its own PanelCache, precomputed before workers start.
+
+    Returns:
+        dict {((start, end), label): price series}
+
+    """
+    caches = {}
+    for key in slices:
+        cache = PanelCache(data.iloc[key[0]:key[1]])
+        caches[key] = cache
+
+    tasks = []
+    for key in sorted(slices):
+        for label, p in zip(labels, params):
+            if only is not None and (key, label) not in only:
+                continue
+            tasks.append((label, p, key))
+
+    for label, p, key in tasks:
+        precompute(factory(**p), caches[key])
+
+    results = _map(_run_task, tasks, (factory, caches, kwargs, False),
+                   n_jobs, backend)
+    return dict(((key, label), prc)
+                for (label, _, key), prc in zip(tasks, results))
+
+
+class WalkForwardResult(ffn.PerformanceStats):
+    """
+    PerformanceStats of a stitched walk-forward equity curve.
+
+    Args:
+        * prices (Series): Stitched out-of-sample prices
+        * windows (DataFrame): One row per window
+        * param_sets (dict): Parameter dicts by label
+
+    Attributes:
+        * windows (DataFrame): Train and test dates, chosen parameter label,
+            its train metric and the test segment return for each window
+        * params (list): Chosen parameter dict for each window
+
+    """
+
+    def __init__(self, prices, windows, param_sets):
+        super(WalkForwardResult, self).__init__(prices)
+        self.windows = windows
+        self.params = [dict(param_sets[x]) for x in windows['params']]
@@ -2,12 +2,20 @@
 
 """
 
+import os
 import re
+import sys
+import threading
+import hashlib
+import inspect
+import tempfile
 import decorator
 import numpy as np
 import pandas as pd
 import datetime
 import time
+from collections import OrderedDict
+from contextlib import contextmanager
 try:
     import cPickle as pickle
 except ImportError:
@@ -17,41 +25,400 @@ __author__ = 'Seung Hyeon Yu'
 __email__ = 'rambor12@business.kaist.ac.kr'
 
 
-def _memoize(func, *args, **kw):
-    # should we refresh the cache?
-    refresh = False
-    refresh_kw = func.mrefresh_keyword
+def unwrap(func):
+    """
+    The original function below memoize/disk_memoize decorators.
+    """
+    while hasattr(func, '__wrapped__'):
+        func = func.__wrapped__
+    return func
 
-    # kw is not always set - check args
-    if refresh_kw in func.__code__.co_varnames:
-        if args[func.__code__.co_varnames.index(refresh_kw)]:
-            refresh = True
 
-    # check in kw if not already set above
-    if not refresh and refresh_kw in kw:
-        if kw[refresh_kw]:
+def _callargs(func, args, kw):
+    """
+    Arguments of a call by name, defaults included, without the refresh
+    keyword(s), and whether a refresh was asked for. Keys built from them
+    do not depend on how the arguments were passed, and refreshed results
+    replace those of the plain call.
+    """
+    callargs = inspect.getcallargs(unwrap(func), *args, **kw)
+    keywords = func.mrefresh_keyword
+    if not isinstance(keywords, (list, tuple)):
+        keywords = (keywords,)
+
+    refresh = False
+    for k in keywords:
+        if k in callargs:
+            refresh = bool(callargs.pop(k)) or refresh
+        elif kw.get(k):
+            # passed through **kwargs
             refresh = True
+    return callargs, refresh
+
 
-    key = pickle.dumps(args, 1) + pickle.dumps(kw, 1)
+def fingerprint(obj):
+    """
+    Content hash of a DataFrame, Series or ndarray, used in memoize keys
+    instead of pickling the whole object.
+    """
+    h = hashlib.sha1()
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        h.update(pd.util.hash_pandas_object(obj, index=True).values.tobytes())
+        if isinstance(obj, pd.DataFrame):
+            h.update(pickle.dumps(list(obj.columns), 2))
+            h.update(pickle.dumps([str(t) for t in obj.dtypes], 2))
+        else:
+            h.update(pickle.dumps((obj.name, str(obj.dtype)), 2))
+        return (type(obj).__name__, obj.shape, h.hexdigest())
+    obj = np.ascontiguousarray(obj)
+    h.update(obj.view(np.uint8) if obj.dtype != object
+             else pickle.dumps(obj, 2))
+    return ('ndarray', obj.dtype.str, obj.shape, h.hexdigest())
+
+
+def _key_part(obj):
+    if isinstance(obj, (pd.DataFrame, pd.Series, np.ndarray)):
+        return fingerprint(obj)
+    if isinstance(obj, (list, tuple)):
+        return (type(obj).__name__,) + tuple(_key_part(o) for o in obj)
+    if isinstance(obj, dict):
+        return ('dict',) + tuple(sorted((k, _key_part(v))
+                                        for k, v in obj.items()))
+    try:
+        hash(obj)
+    except TypeError:
+        return ('pickle', pickle.dumps(obj, 2))
+    # type is part of the key so that 1, 1.0 and True differ, like they
+    # did with pickled keys
+    return (type(obj), obj)
+
+
+def _light(obj):
+    """
+    obj with its DataFrames, Series and ndarrays (in lists, tuples and
+    dicts as well) replaced by their fingerprint. Cached entries keep
+    light call arguments, so they don't keep the arguments alive.
+    """
+    if isinstance(obj, (pd.DataFrame, pd.Series, np.ndarray)):
+        return fingerprint(obj)
+    if isinstance(obj, list):
+        return [_light(o) for o in obj]
+    if isinstance(obj, tuple):
+        return tuple(_light(o) for o in obj)
+    if isinstance(obj, dict):
+        return dict((k, _light(v)) for k, v in obj.items())
+    return obj
+
+
+def _make_key(callargs):
+    """
+    Cheap hashable key of a call. Arrays and pandas objects are keyed by
+    content fingerprint.
+    """
+    return tuple(sorted((k, _key_part(v)) for k, v in callargs.items()))
+
+
+def _sizeof(obj):
+    """
+    Approximate memory used by a memoized result, in bytes.
+    """
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(index=True))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    return sys.getsizeof(obj)
+
+
+# per thread flag set by uncached()
+_UNCACHED = threading.local()
+
+
+@contextmanager
+def uncached():
+    """
+    Context manager bypassing every memoize and disk_memoize cache (reads
+    and writes) for calls made in the current thread, nested calls
+    included.
+
+    Ex:
+        with uncached():
+            prices = web('005930')
+
+    """
+    previous = getattr(_UNCACHED, 'on', False)
+    _UNCACHED.on = True
+    try:
+        yield
+    finally:
+        _UNCACHED.on = previous
+
+
+def _memoize(func, *args, **kw):
+    if getattr(_UNCACHED, 'on', False):
+        return func(*args, **kw)
+
+    # should we refresh the cache?
+    callargs, refresh = _callargs(func, args, kw)
+
+    callargs = _light(callargs)
+    key = _make_key(callargs)
 
     cache = func.mcache
-    if not refresh and key in cache:
-        return cache[key]
-    else:
-        cache[key] = result = func(*args, **kw)
-        return result
+    stats = func.mstats
+    if not refresh:
+        with func.mlock:
+            if key in cache:
+                # most recently used last
+                result = cache.pop(key)
+                cache[key] = result
+                stats['hits'] += 1
+                return result
+            stats['misses'] += 1
+
+    result = func(*args, **kw)
+    _store(func, key, callargs, result)
+    return result
 
 
-def memoize(f, refresh_keyword='mrefresh'):
+def _store(func, key, callargs, result):
+    cache = func.mcache
+    stats = func.mstats
+    size = _sizeof(result)
+    max_entries, max_bytes = func.mmax_entries, func.mmax_bytes
+    with func.mlock:
+        if key in cache:
+            cache.pop(key)
+            stats['bytes'] -= func.msizes.pop(key)
+        cache[key] = result
+        func.msizes[key] = size
+        func.mcalls[key] = callargs
+        stats['bytes'] += size
+
+        # evict least recently used entries, but keep the new one
+        while len(cache) > 1 and (
+                (max_entries is not None and len(cache) > max_entries) or
+                (max_bytes is not None and stats['bytes'] > max_bytes)):
+            old = next(iter(cache))
+            _drop(func, old)
+            stats['evictions'] += 1
+
+
+def _drop(func, key):
+    del func.mcache[key]
+    del func.mcalls[key]
+    func.mstats['bytes'] -= func.msizes.pop(key)
+
+
+def memoize(f=None, refresh_keyword='mrefresh', max_entries=None,
+            max_bytes=None):
     """
     Memoize decorator. The refresh keyword is the keyword
-    used to bypass the cache (in the function call).
+    used to bypass the cache (in the function call). The result of a
+    refreshed call replaces the cached one.
+
+    Results are kept in least recently used order and evicted once there
+    are more than max_entries results or they use more than max_bytes.
+    DataFrame, Series and ndarray arguments are keyed by a content
+    fingerprint.
+
+    Can be used bare (@memoize) or with arguments
+    (@memoize(max_entries=100)).
+
+    Attributes set on the decorated function:
+        * mcache (OrderedDict): key -> result
+        * mcalls (dict): key -> call arguments by name, with DataFrame,
+            Series and ndarray arguments replaced by their fingerprint
+        * mstats (dict): hits, misses, evictions and bytes (size of
+            cached results)
+
+    Args:
+        * refresh_keyword (str, tuple): keyword(s) bypassing the cache
+        * max_entries (int): maximum number of cached results
+        * max_bytes (int): maximum size of cached results
+
     """
-    f.mcache = {}
+    if f is None:
+        return lambda f: memoize(f, refresh_keyword=refresh_keyword,
+                                 max_entries=max_entries, max_bytes=max_bytes)
+    f.mcache = OrderedDict()
+    f.msizes = {}
+    f.mcalls = {}
+    f.mstats = {'hits': 0, 'misses': 0, 'evictions': 0, 'bytes': 0}
+    f.mlock = threading.Lock()
     f.mrefresh_keyword = refresh_keyword
+    f.mmax_entries = max_entries
+    f.mmax_bytes = max_bytes
     return decorator.decorator(_memoize, f)
 
 
+def clear_memoize(f):
+    """
+    Empty the memoize cache of f and reset its statistics.
+    """
+    with f.mlock:
+        f.mcache.clear()
+        f.msizes.clear()
+        f.mcalls.clear()
+        f.mstats.update(hits=0, misses=0, evictions=0, bytes=0)
+
+
+def memoize_get(f, *args, **kw):
+    """
+    Look up the cached result of f(*args, **kw) without calling f.
+
+    Returns:
+        (found, result) - result is None if not found
+
+    """
+    key = _make_key(_light(_callargs(f, args, kw)[0]))
+    with f.mlock:
+        if key in f.mcache:
+            return True, f.mcache[key]
+    return False, None
+
+
+def memoize_set(f, result, *args, **kw):
+    """
+    Store result as the result of f(*args, **kw), in the memoize cache
+    and, if f is disk_memoize decorated and the disk cache is on, on disk.
+    """
+    callargs = _callargs(f, args, kw)[0]
+    if hasattr(f, 'mcache'):
+        light = _light(callargs)
+        _store(f, _make_key(light), light, result)
+    if getattr(f, 'mdisk', False) and _DISK_CACHE['path'] is not None:
+        _disk_write(_disk_path(unwrap(f), callargs), result)
+
+
+def memoize_forget(f, match):
+    """
+    Remove the cached results of the calls for which match(callargs) is
+    True, where callargs maps argument names to values (DataFrame, Series
+    and ndarray values are replaced by their fingerprint, see fingerprint).
+
+    Returns:
+        number of removed results
+
+    """
+    with f.mlock:
+        keys = [k for k, callargs in f.mcalls.items() if match(callargs)]
+        for k in keys:
+            _drop(f, k)
+    return len(keys)
+
+
+# directory and time to live (seconds) of the disk cache. See set_cache_dir.
+_DISK_CACHE = {'path': None, 'ttl': None}
+
+
+def set_cache_dir(path, ttl=None):
+    """
+    Enable the disk cache of disk_memoize decorated functions (data
+    providers). Results are stored in path and reused by later sessions.
+
+    Args:
+        * path (str): Cache directory. None disables the disk cache.
+        * ttl (float): Seconds a stored result stays valid. None keeps
+            results until they are refreshed with mrefresh=True or the
+            cache is cleared.
+
+    """
+    if path is not None and not os.path.isdir(path):
+        os.makedirs(path)
+    _DISK_CACHE['path'] = path
+    _DISK_CACHE['ttl'] = ttl
+
+
+def clear_cache_dir(name=None):
+    """
+    Remove stored results of the function called name, or of all
+    functions if name is None.
+    """
+    root = _DISK_CACHE['path']
+    if root is None:
+        return
+    dirs = [name] if name is not None else os.listdir(root)
+    for d in dirs:
+        d = os.path.join(root, d)
+        if not os.path.isdir(d):
+            continue
+        for f in os.listdir(d):
+            if f.endswith('.pkl'):
+                os.remove(os.path.join(d, f))
+
+
+def _disk_path(func, callargs):
+    key = hashlib.sha1(
+        pickle.dumps(sorted(callargs.items()), 2)).hexdigest()
+    return os.path.join(_DISK_CACHE['path'], func.__name__, key + '.pkl')
+
+
+def _disk_write(path, result):
+    d = os.path.dirname(path)
+    if not os.path.isdir(d):
+        try:
+            os.makedirs(d)
+        except OSError:
+            # created by another process
+            pass
+    # write to a temp file first so readers never see a partial file
+    fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=d)
+    os.close(fd)
+    try:
+        pd.to_pickle(result, tmp)
+        if hasattr(os, 'replace'):
+            # atomic, existing file or not
+            os.replace(tmp, path)
+        else:
+            # python 2 - rename fails on windows if path exists
+            if os.path.exists(path):
+                os.remove(path)
+            os.rename(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _disk_memoize(func, *args, **kw):
+    if _DISK_CACHE['path'] is None or getattr(_UNCACHED, 'on', False):
+        return func(*args, **kw)
+
+    # key on the bound arguments so positional and keyword calls match
+    callargs, refresh = _callargs(func, args, kw)
+    path = _disk_path(func, callargs)
+    ttl = _DISK_CACHE['ttl']
+    if not refresh and os.path.exists(path):
+        if ttl is None or time.time() - os.path.getmtime(path) < ttl:
+            try:
+                return pd.read_pickle(path)
+            except Exception:
+                # corrupt or incompatible file - fetch again
+                pass
+
+    result = func(*args, **kw)
+    _disk_write(path, result)
+    return result
+
+
+def disk_memoize(f, refresh_keyword='mrefresh'):
+    """
+    Disk cache decorator for data providers. Results are pickled (the
+    fastest binary format for pandas objects without extra dependencies)
+    to the directory set with set_cache_dir, keyed by the function and
+    all of its arguments (ticker, field, source, start, end, ...).
+
+    The refresh keyword bypasses and rewrites the stored result, like it
+    does for memoize. Without a cache directory the function is called
+    directly. Use memoize on top to keep results in memory as well.
+    """
+    f.mrefresh_keyword = refresh_keyword
+    f.mdisk = True
+    return decorator.decorator(_disk_memoize, f)
+
+
 def parse_arg(arg):
     """
     Parses arguments for convenience. Argument can be a
@@ -0,0 +1,14 @@
+"""
+KSIF benchmarks
+
+Reproducible performance benchmarks on synthetic Korean-market universes.
+
+    python -m benchmarks run --size medium --output current.json
+    python -m benchmarks compare baseline.json current.json
+
+"""
+from .universe import make_prices, make_universe, to_vendor_csv
+from .suite import WORKLOADS, run_suite, compare, save, load
+
+__author__ = 'Seung Hyeon Yu'
+__email__ = 'rambor12@business.kaist.ac.kr'
@@ -0,0 +1,69 @@
+"""
+Command line entry point: python -m benchmarks {run, compare, list}
+
+"""
+from __future__ import print_function
+import argparse
+import sys
+
+from .suite import WORKLOADS, run_suite, compare, save, load
+
+__author__ = 'Seung Hyeon Yu'
+__email__ = 'rambor12@business.kaist.ac.kr'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    sub = parser.add_subparsers(dest='command')
+
+    run = sub.add_parser('run', help='run the benchmark suite')
+    run.add_argument('workloads', nargs='*',
+                     help='workloads to run (default: all)')
+    run.add_argument('--size', default='small',
+                     choices=['small', 'medium', 'large'])
+    run.add_argument('--repeat', type=int, default=3)
+    run.add_argument('--seed', type=int, default=0)
+    run.add_argument('--nsim', type=int, default=10)
+    run.add_argument('--no-memory', action='store_true',
+                     help='skip peak memory measurement')
+    run.add_argument('--output', help='write results to this JSON file')
+    run.add_argument('--baseline',
+                     help='compare results against this JSON file')
+    run.add_argument('--threshold', type=float, default=0.1)
+
+    cmp_ = sub.add_parser('compare', help='compare two result files')
+    cmp_.add_argument('baseline')
+    cmp_.add_argument('current')
+    cmp_.add_argument('--threshold', type=float, default=0.1)
+
+    sub.add_parser('list', help='list workloads')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'list':
+        for name in WORKLOADS:
+            print(name)
+        return 0
+
+    if args.command == 'run':
+        res = run_suite(args.workloads or None, size=args.size,
+                        repeat=args.repeat, seed=args.seed, nsim=args.nsim,
+                        memory=not args.no_memory)
+        if args.output:
+            save(res, args.output)
+        if args.baseline:
+            table = compare(load(args.baseline), res, args.threshold)
+            return int(table['regression'].any())
+        return 0
+
+    if args.command == 'compare':
+        table = compare(load(args.baseline), load(args.current),
+                        args.threshold)
+        return int(table['regression'].any())
+
+    parser.print_help()
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,309 @@
+"""
+Benchmark workloads, timing and regression comparison.
+
+"""
+from __future__ import division, print_function
+from collections import OrderedDict
+from timeit import default_timer
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+import KSIF as kf
+from KSIF.core import algos, ffn
+from KSIF.core.base import Strategy
+
+from .universe import make_universe, to_vendor_csv
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+__author__ = 'Seung Hyeon Yu'
+__email__ = 'rambor12@business.kaist.ac.kr'
+
+
+WORKLOADS = OrderedDict()
+
+
+def workload(name):
+    """
+    Register a benchmark workload. The decorated function receives the
+    context dict built by make_context and runs the workload once.
+    """
+    def deco(fn):
+        WORKLOADS[name] = fn
+        return fn
+    return deco
+
+
+def _backtest(strategy, prices, **kwargs):
+    bkt = kf.Backtest(strategy, prices, progress_bar=False, **kwargs)
+    bkt.run()
+    return bkt
+
+
+def _monthly_equal_weight():
+    return Strategy('monthly_equal_weight', [
+        algos.RunMonthly(),
+        algos.SelectAll(),
+        algos.WeighEqually(),
+        algos.Rebalance()])
+
+
+def _daily_momentum():
+    return Strategy('daily_momentum', [
+        algos.RunDaily(),
+        algos.SelectHasData(lookback=pd.DateOffset(months=3)),
+        algos.SelectMomentum(n=20, lookback=pd.DateOffset(months=3)),
+        algos.WeighEqually(),
+        algos.Rebalance()])
+
+
+@workload('monthly_equal_weight')
+def monthly_equal_weight(ctx):
+    _backtest(_monthly_equal_weight(), ctx['prices'])
+
+
+@workload('daily_momentum')
+def daily_momentum(ctx):
+    _backtest(_daily_momentum(), ctx['prices'])
+
+
+@workload('inverse_vol')
+def inverse_vol(ctx):
+    s = Strategy('inverse_vol', [
+        algos.RunMonthly(),
+        algos.SelectHasData(lookback=pd.DateOffset(months=3)),
+        algos.WeighInvVol(lookback=pd.DateOffset(months=3)),
+        algos.Rebalance()])
+    _backtest(s, ctx['prices'])
+
+
+@workload('mean_var')
+def mean_var(ctx):
+    s = Strategy('mean_var', [
+        algos.RunMonthly(),
+        algos.SelectHasData(lookback=pd.DateOffset(months=3)),
+        algos.SelectMomentum(n=10, lookback=pd.DateOffset(months=3)),
+        algos.WeighMeanVar(lookback=pd.DateOffset(months=3)),
+        algos.Rebalance()])
+    _backtest(s, ctx['prices'])
+
+
+@workload('strategy_of_strategies')
+def strategy_of_strategies(ctx):
+    s = Strategy('parent', [
+        algos.RunMonthly(),
+        algos.SelectAll(),
+        algos.WeighEqually(),
+        algos.Rebalance()],
+        [_monthly_equal_weight(), _daily_momentum()])
+    _backtest(s, ctx['prices'])
+
+
+@workload('benchmark_random')
+def benchmark_random(ctx):
+    bkt = kf.Backtest(_monthly_equal_weight(), ctx['prices'],
+                      progress_bar=False)
+    rnd = Strategy('random', [
+        algos.RunMonthly(),
+        algos.SelectAll(),
+        algos.SelectRandomly(n=20),
+        algos.WeighEqually(),
+        algos.Rebalance()])
+    kf.backtest.benchmark_random(bkt, rnd, nsim=ctx['nsim'])
+
+
+@workload('performance_stats')
+def performance_stats(ctx):
+    ffn.PerformanceStats(ctx['index'])
+
+
+@workload('group_stats')
+def group_stats(ctx):
+    ffn.GroupStats(ctx['indices'])
+
+
+@workload('csv_load')
+def csv_load(ctx):
+    kf.data.get(ctx['csv_path'], mrefresh=True)
+
+
+def make_context(size='small', seed=0, nsim=10, workdir=None):
+    """
+    Build the shared inputs of all workloads: a synthetic universe, a long
+    index series, a panel of complete series for GroupStats and a vendor
+    style CSV export of the universe.
+    """
+    prices = make_universe(size, seed=seed)
+    # complete (no NaN) panel used for the stats workloads
+    indices = make_universe(size, nan_rate=0., listing_rate=0.,
+                            delisting_rate=0., seed=seed + 1)
+    indices = indices.rebase()
+
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix='ksif_bench_')
+    csv_path = to_vendor_csv(prices, os.path.join(workdir, 'universe.csv'))
+
+    return {'size': size, 'seed': seed, 'nsim': nsim, 'prices': prices,
+            'index': indices[indices.columns[0]], 'indices': indices,
+            'csv_path': csv_path, 'workdir': workdir}
+
+
+def _seed(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def time_workload(fn, ctx, repeat=3, memory=True):
+    """
+    Time a workload.
+
+    Every repetition is seeded identically so random strategies are
+    reproducible. Peak memory is measured with tracemalloc on a separate,
+    untimed pass since tracing slows execution down.
+
+    Returns:
+        dict with times (list of seconds), min, mean and peak_memory
+        (bytes, None if tracemalloc is unavailable or memory is False)
+
+    """
+    times = []
+    for _ in range(repeat):
+        _seed(ctx['seed'])
+        start = default_timer()
+        fn(ctx)
+        times.append(default_timer() - start)
+
+    peak = None
+    if memory and tracemalloc is not None:
+        _seed(ctx['seed'])
+        tracemalloc.start()
+        try:
+            fn(ctx)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return {'times': times, 'min': min(times),
+            'mean': sum(times) / len(times), 'peak_memory': peak}
+
+
+def run_suite(names=None, size='small', repeat=3, seed=0, nsim=10,
+              memory=True, verbose=True):
+    """
+    Run workloads and return the results as a JSON serializable dict.
+
+    Args:
+        * names (list): workloads to run - all registered workloads if None
+        * size (str): universe preset, see universe.PRESETS
+        * repeat (int): timed repetitions per workload
+        * seed (int): random seed for data and random strategies
+        * nsim (int): number of random strategies in benchmark_random
+        * memory (bool): measure peak memory
+        * verbose (bool): print progress
+
+    """
+    if names is None:
+        names = list(WORKLOADS.keys())
+
+    unknown = [n for n in names if n not in WORKLOADS]
+    if unknown:
+        raise ValueError('unknown workloads: %s' % ', '.join(unknown))
+
+    ctx = make_context(size, seed=seed, nsim=nsim)
+    try:
+        results = OrderedDict()
+        for name in names:
+            res = time_workload(WORKLOADS[name], ctx, repeat=repeat,
+                                memory=memory)
+            results[name] = res
+            if verbose:
+                print('%-24s min %9.4fs  mean %9.4fs  peak %s' % (
+                    name, res['min'], res['mean'], _fmt_bytes(
+                        res['peak_memory'])))
+    finally:
+        shutil.rmtree(ctx['workdir'], ignore_errors=True)
+
+    meta = {'date': datetime.datetime.now().isoformat(),
+            'size': size, 'repeat': repeat, 'seed': seed, 'nsim': nsim,
+            'shape': list(ctx['prices'].shape),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__, 'pandas': pd.__version__,
+            'ksif': '.'.join(str(x) for x in kf.__version__)}
+
+    return {'meta': meta, 'results': results}
+
+
+def save(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline, current, threshold=0.1, verbose=True):
+    """
+    Compare two suite results by their best (min) time.
+
+    A workload regressed if current time exceeds the baseline by more than
+    threshold (relative). Peak memory is compared the same way.
+
+    Args:
+        * baseline (dict): results of run_suite (or load)
+        * current (dict): results of run_suite (or load)
+        * threshold (float): allowed relative slowdown
+
+    Returns:
+        DataFrame with one row per workload present in both results and a
+        boolean 'regression' column
+
+    """
+    rows = []
+    base = baseline['results']
+    cur = current['results']
+    for name in cur:
+        if name not in base:
+            continue
+        b, c = base[name], cur[name]
+        ratio = c['min'] / b['min'] if b['min'] > 0 else np.nan
+        mem_ratio = np.nan
+        if b.get('peak_memory') and c.get('peak_memory'):
+            mem_ratio = c['peak_memory'] / b['peak_memory']
+        rows.append([name, b['min'], c['min'], ratio, mem_ratio,
+                     ratio > 1 + threshold or mem_ratio > 1 + threshold])
+
+    res = pd.DataFrame(rows, columns=['workload', 'baseline', 'current',
+                                      'time_ratio', 'memory_ratio',
+                                      'regression']).set_index('workload')
+
+    if verbose:
+        for name, r in res.iterrows():
+            print('%-24s %9.4fs -> %9.4fs  x%.2f  mem x%.2f%s' % (
+                name, r['baseline'], r['current'], r['time_ratio'],
+                r['memory_ratio'], '  REGRESSION' if r['regression'] else ''))
+
+    return res
+
+
+def _fmt_bytes(n):
+    if n is None:
+        return '-'
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if n < 1024:
+            return '%.1f%s' % (n, unit)
+        n /= 1024
+    return '%.1fTB' % n
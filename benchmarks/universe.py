@@ -0,0 +1,130 @@
+"""
+Synthetic Korean-market price panels for benchmarking.
+
+"""
+from __future__ import division
+import numpy as np
+import pandas as pd
+
+__author__ = 'Seung Hyeon Yu'
+__email__ = 'rambor12@business.kaist.ac.kr'
+
+
+def make_tickers(n, seed=0):
+    """
+    Return n unique KRX style stock codes ('A005930', ...).
+
+    Args:
+        * n (int): number of tickers
+        * seed (int): random seed
+
+    """
+    rs = np.random.RandomState(seed)
+    codes = rs.choice(999999, size=n, replace=False)
+    return ['A%06d' % c for c in sorted(codes)]
+
+
+def make_prices(n_tickers=100, n_days=2520, start='2000-01-04',
+                nan_rate=0.0, listing_rate=0.0, delisting_rate=0.0,
+                price_level=(1000., 500000.), drift=0.05, vol=0.35,
+                seed=0):
+    """
+    Generate a (dates x tickers) DataFrame of daily prices.
+
+    Prices follow a geometric random walk on business days and are rounded
+    to whole won, like KRX closing prices.
+
+    Args:
+        * n_tickers (int): number of tickers
+        * n_days (int): number of business days
+        * start (str): first date
+        * nan_rate (float): fraction of missing (NaN) observations scattered
+            at random over listed periods, e.g. trading halts
+        * listing_rate (float): fraction of tickers listed after the first
+            date. Prices before the listing date are NaN.
+        * delisting_rate (float): fraction of tickers delisted before the
+            last date. Prices after the delisting date are NaN.
+        * price_level ((low, high)): range of initial prices. Initial prices
+            are log-uniform within this range.
+        * drift (float): annual drift
+        * vol (float): annual volatility
+        * seed (int): random seed
+
+    Returns:
+        DataFrame
+
+    """
+    rs = np.random.RandomState(seed)
+    dates = pd.bdate_range(start, periods=n_days)
+    tickers = make_tickers(n_tickers, seed)
+
+    low, high = np.log(price_level[0]), np.log(price_level[1])
+    p0 = np.exp(rs.uniform(low, high, n_tickers))
+
+    dt = 1. / 252
+    rets = rs.normal((drift - 0.5 * vol ** 2) * dt, vol * np.sqrt(dt),
+                     (n_days, n_tickers))
+    rets[0] = 0.
+    prices = np.round(p0 * np.exp(np.cumsum(rets, axis=0)))
+    # prices can not go below 1 won
+    prices = np.maximum(prices, 1.)
+
+    cols = np.arange(n_tickers)
+    if listing_rate > 0:
+        listed = cols[rs.rand(n_tickers) < listing_rate]
+        for i in listed:
+            prices[:rs.randint(1, n_days), i] = np.nan
+
+    if delisting_rate > 0:
+        delisted = cols[rs.rand(n_tickers) < delisting_rate]
+        for i in delisted:
+            prices[rs.randint(1, n_days):, i] = np.nan
+
+    if nan_rate > 0:
+        prices[rs.rand(n_days, n_tickers) < nan_rate] = np.nan
+
+    return pd.DataFrame(prices, index=dates, columns=tickers)
+
+
+def to_vendor_csv(prices, path):
+    """
+    Write prices the way Korean data vendors export them: euc-kr encoded,
+    a 'DATE' column and thousands separators in quoted values. This is
+    the format read by KSIF.data.get for .csv paths.
+
+    Args:
+        * prices (DataFrame): price panel
+        * path (str): file path
+
+    """
+    out = prices.copy()
+    out = out.apply(lambda c: c.map(
+        lambda x: '' if np.isnan(x) else '{:,.0f}'.format(x)))
+    out.index = out.index.strftime('%Y-%m-%d')
+    out.index.name = 'DATE'
+    out.to_csv(path, encoding='euc-kr')
+    return path
+
+
+PRESETS = {
+    'small': dict(n_tickers=50, n_days=756),
+    'medium': dict(n_tickers=200, n_days=2520),
+    'large': dict(n_tickers=2000, n_days=5040),
+}
+
+
+def make_universe(size='small', nan_rate=0.01, listing_rate=0.2,
+                  delisting_rate=0.1, seed=0, **kwargs):
+    """
+    Preset universes used by the benchmark suite.
+
+    Args:
+        * size (str): 'small', 'medium' or 'large'. See PRESETS.
+        * kwargs: passed to make_prices and override the preset
+
+    """
+    params = dict(PRESETS[size])
+    params.update(nan_rate=nan_rate, listing_rate=listing_rate,
+                  delisting_rate=delisting_rate, seed=seed)
+    params.update(kwargs)
+    return make_prices(**params)
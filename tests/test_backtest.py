@@ -0,0 +1,100 @@
+from __future__ import division
+import numpy as np
+import pandas as pd
+import pytest
+import KSIF as kf
+from KSIF.core import algos
+from KSIF.core.backtest import to_float32
+from KSIF.core.base import PanelCache, Strategy
+
+__author__ = 'Seung Hyeon Yu'
+__email__ = 'rambor12@business.kaist.ac.kr'
+
+
+# bound asserted on the relative NAV deviation of float32 runs
+FLOAT32_NAV_TOLERANCE = 1e-6
+
+
+def make_prices(n_tickers=50, n_days=500, seed=7):
+    """
+    Random walk of adjusted (non integer) prices between about 1e3 and 1e5,
+    where float32 rounding is the largest relative to the price.
+    """
+    rng = np.random.RandomState(seed)
+    dates = pd.bdate_range('2010-01-01', periods=n_days)
+    start = np.exp(rng.uniform(np.log(1e3), np.log(1e5), n_tickers))
+    steps = rng.normal(0.0003, 0.02, (n_days, n_tickers))
+    prices = start * np.exp(np.cumsum(steps, axis=0)) * 1.0001234567
+    return pd.DataFrame(prices, index=dates,
+                        columns=['s%03d' % i for i in range(n_tickers)])
+
+
+def run(data, run_algo, **kwargs):
+    strategy = Strategy('s', [run_algo, algos.SelectAll(),
+                              algos.WeighEqually(), algos.Rebalance()])
+    bkt = kf.Backtest(strategy, data, progress_bar=False, **kwargs)
+    bkt.run()
+    return bkt
+
+
+@pytest.mark.parametrize('run_algo', [algos.RunDaily, algos.RunMonthly])
+def test_float32_nav_deviation(run_algo):
+    data = make_prices()
+    exact = run(data, run_algo()).strategy.prices
+    approx = run(data, run_algo(), float32=True).strategy.prices
+    assert exact.index.equals(approx.index)
+    deviation = (approx / exact - 1).abs().max()
+    assert deviation < FLOAT32_NAV_TOLERANCE
+
+
+def test_float32_whole_prices_exact():
+    data = make_prices().round()
+    exact = run(data, algos.RunDaily()).strategy.prices
+    approx = run(data, algos.RunDaily(), float32=True).strategy.prices
+    assert np.array_equal(exact.values, approx.values)
+
+
+def test_float32_stores_float32():
+    data = make_prices(n_tickers=5, n_days=50)
+    bkt = run(data, algos.RunDaily(), float32=True)
+    assert (bkt.data.dtypes == np.float32).all()
+    assert (bkt.weights.dtypes == np.float32).all()
+    assert bkt.strategy.prices.dtype == np.float64
+
+
+def test_float32_cache_on_converted_data():
+    data = make_prices(n_tickers=5, n_days=50)
+    converted = to_float32(data)
+    assert to_float32(converted) is converted
+    cache = PanelCache(converted)
+    for d in (data, converted):
+        bkt = kf.Backtest(Strategy('s', []), d, cache=cache, float32=True)
+        assert bkt.data is converted
+        assert bkt.cache is cache
+
+
+def test_float32_cache_on_float64_data():
+    data = make_prices(n_tickers=5, n_days=50)
+    with pytest.raises(ValueError):
+        kf.Backtest(Strategy('s', []), data, cache=PanelCache(data),
+                    float32=True)
+
+
+def test_paper_trading_profiled():
+    data = make_prices(n_tickers=5, n_days=100)
+    child = Strategy('child', [algos.RunMonthly(), algos.SelectAll(),
+                               algos.WeighEqually(), algos.Rebalance()],
+                     list(data.columns[:3]))
+    parent = Strategy('parent', [algos.RunMonthly(), algos.SelectAll(),
+                                 algos.WeighEqually(), algos.Rebalance()],
+                      [child])
+    bkt = kf.Backtest(parent, data, progress_bar=False, profile=True,
+                      engine_counters=True)
+    bkt.run()
+
+    paper = bkt.strategy.children['child']._paper
+    assert paper._profiler is bkt.strategy._profiler
+    assert paper._counters is bkt.strategy._counters
+    # the paper strategy is its own root, profiled under its name
+    strategies = bkt.algo_stats.index.get_level_values('strategy')
+    assert 'child' in strategies and 'parent>child' in strategies
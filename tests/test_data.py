@@ -0,0 +1,280 @@
+from __future__ import division
+import os
+import threading
+import time
+import warnings
+import numpy as np
+import pandas as pd
+import pytest
+import KSIF.core.utils as utils
+from KSIF.core import data
+
+__author__ = 'Seung Hyeon Yu'
+__email__ = 'rambor12@business.kaist.ac.kr'
+
+
+DATES = pd.bdate_range('2020-01-01', periods=30)
+
+
+class FakeDataReader(object):
+    """
+    Stands in for pandas_datareader.DataReader. history maps tickers to
+    prices and can be changed between calls.
+    """
+
+    def __init__(self, history):
+        self.history = history
+        self.calls = []
+
+    def __call__(self, name, data_source=None, start=None, end=None):
+        self.calls.append((name, start))
+        prices = self.history[name]
+        if start is not None:
+            prices = prices[prices.index >= start]
+        return pd.DataFrame({'Adj Close': prices})
+
+
+def setup_web(monkeypatch, history):
+    reader = FakeDataReader(history)
+    monkeypatch.setattr(data.pdata, 'DataReader', reader)
+    utils.clear_memoize(data.web)
+    utils.clear_memoize(data._download_web)
+    utils.clear_memoize(data.get)
+    return reader
+
+
+def test_web_mrefresh_downloads_again(monkeypatch):
+    history = {'AAA': pd.Series(np.arange(20.), index=DATES[:20])}
+    reader = setup_web(monkeypatch, history)
+
+    data.web('AAA')
+    history['AAA'] = history['AAA'] * 2
+    assert data.web('AAA').iloc[-1] == 19.
+    assert data.web('AAA', mrefresh=True).iloc[-1] == 38.
+    assert len(reader.calls) == 2
+
+
+def test_incremental_appends_tail(monkeypatch):
+    full = pd.Series(np.arange(30.), index=DATES)
+    history = {'AAA': full[:20]}
+    reader = setup_web(monkeypatch, history)
+
+    data.get('AAA')
+    history['AAA'] = full[:25]
+    res = data.get('AAA', incremental=True)
+
+    assert res['aaa'].equals(full[:25])
+    # only the tail was downloaded, from the overlap on
+    assert reader.calls[-1] == ('AAA', DATES[20 - data.INCREMENTAL_OVERLAP])
+    # the merged history replaced the cached one and tails are not cached
+    assert data.web('AAA').equals(full[:25])
+    assert len(data._download_web.mcache) == 1
+    # plain get sees the update
+    assert data.get('AAA')['aaa'].equals(full[:25])
+
+
+def test_incremental_revised_history(monkeypatch):
+    full = pd.Series(np.arange(30.), index=DATES)
+    history = {'AAA': full[:20]}
+    reader = setup_web(monkeypatch, history)
+
+    data.get('AAA')
+    # prices adjusted for a dividend - cached history is stale
+    history['AAA'] = full[:25] * 0.9
+    res = data.get('AAA', incremental=True)
+
+    assert np.allclose(res['aaa'], full[:25] * 0.9)
+    assert reader.calls[-1] == ('AAA', None)
+    assert np.allclose(data.web('AAA'), full[:25] * 0.9)
+    assert np.allclose(data.get('AAA')['aaa'], full[:25] * 0.9)
+
+
+def test_incremental_unchanged(monkeypatch):
+    full = pd.Series(np.arange(20.), index=DATES[:20])
+    reader = setup_web(monkeypatch, {'AAA': full})
+
+    data.get('AAA')
+    res = data.get('AAA', incremental=True)
+    assert res['aaa'].equals(full)
+    assert len(reader.calls) == 2
+
+
+class FakeProvider(object):
+    """
+    Provider simulating network latency. Tickers listed in fails raise
+    that many times before succeeding, tickers in slow take slow seconds.
+    """
+
+    def __init__(self, latency=0.05, fails=None, slow=None):
+        self.latency = latency
+        self.fails = dict(fails or {})
+        self.slow = slow or {}
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, ticker, field=None, source=None, **kwargs):
+        with self.lock:
+            self.calls.append(ticker)
+        time.sleep(self.slow.get(ticker, self.latency))
+        with self.lock:
+            if self.fails.get(ticker, 0) > 0:
+                self.fails[ticker] -= 1
+                raise IOError('connection reset')
+        return pd.Series(float(len(ticker)), index=DATES[:5])
+
+
+def test_concurrent_get_keeps_order():
+    tickers = ['t%02d' % i for i in range(20)][::-1]
+    provider = FakeProvider(latency=0.05)
+
+    t0 = time.time()
+    res = data.get(tickers, provider=provider, max_workers=10,
+                   mrefresh=True)
+    elapsed = time.time() - t0
+
+    assert list(res.columns) == tickers
+    assert sorted(provider.calls) == sorted(tickers)
+    # 20 downloads of 50ms, 10 at a time
+    assert elapsed < 0.5
+
+
+def test_concurrent_get_retries(monkeypatch):
+    monkeypatch.setattr(data, 'RETRY_PAUSE', 0.001)
+    provider = FakeProvider(latency=0.01, fails={'a': 2})
+
+    res = data.get(['a', 'b'], provider=provider, max_workers=2, retries=2,
+                   mrefresh=True)
+    assert list(res.columns) == ['a', 'b']
+    assert provider.calls.count('a') == 3
+
+    provider = FakeProvider(latency=0.01, fails={'a': 2})
+    with pytest.raises(IOError):
+        data.get(['a', 'b'], provider=provider, max_workers=2, retries=1,
+                 mrefresh=True)
+
+
+def test_concurrent_get_timeout():
+    provider = FakeProvider(latency=0.01, slow={'hang': 2.})
+    with pytest.raises(ValueError):
+        data.get(['b', 'hang'], provider=provider, max_workers=2,
+                 timeout=0.2, mrefresh=True)
+
+
+def test_timeout_counts_from_download_start():
+    # c and d wait in the queue for longer than the timeout, but their own
+    # downloads are within it
+    provider = FakeProvider(latency=0.15)
+    res = data.get(['a', 'b', 'c', 'd'], provider=provider, max_workers=2,
+                   timeout=0.25, mrefresh=True)
+    assert list(res.columns) == ['a', 'b', 'c', 'd']
+
+    # the time spent waiting for x does not extend the allowance of slow
+    provider = FakeProvider(slow={'x': 0.25, 'slow': 0.45})
+    with pytest.raises(ValueError):
+        data.get(['x', 'slow'], provider=provider, max_workers=2,
+                 timeout=0.3, mrefresh=True)
+
+
+def test_serial_timeout_warns():
+    provider = FakeProvider(latency=0.)
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter('always')
+        data.get(['a', 'b'], provider=provider, timeout=1., mrefresh=True)
+    assert any('timeout' in str(x.message) for x in w)
+
+
+def write_csv(path, scale=1.):
+    pd.DataFrame({'AAA': np.arange(5.) * scale, 'BBB': np.arange(5.) + 1},
+                 index=DATES[:5]).to_csv(path)
+
+
+def count_parses(monkeypatch):
+    calls = []
+    read_csv = pd.read_csv
+
+    def counting(path, **kwargs):
+        calls.append(path)
+        return read_csv(path, **kwargs)
+
+    monkeypatch.setattr(data.pd, 'read_csv', counting)
+    utils.clear_memoize(data._parse_csv)
+    utils.clear_memoize(data.get)
+    return calls
+
+
+def test_csv_parsed_once(tmpdir, monkeypatch):
+    path = str(tmpdir.join('prices.csv'))
+    write_csv(path)
+    calls = count_parses(monkeypatch)
+
+    res = data.get('AAA,BBB', provider=data.csv, path=path)
+    assert res['bbb'].tolist() == [1., 2., 3., 4., 5.]
+    assert len(calls) == 1
+
+    # mrefresh parses the file again, once for all tickers
+    data.get('AAA,BBB', provider=data.csv, path=path, mrefresh=True)
+    assert len(calls) == 2
+    data.get('AAA,BBB', provider=data.csv, path=path)
+    assert len(calls) == 2
+
+
+def test_csv_modified_file(tmpdir, monkeypatch):
+    path = str(tmpdir.join('prices.csv'))
+    write_csv(path)
+    count_parses(monkeypatch)
+
+    assert data.csv('AAA', path=path).iloc[-1] == 4.
+    write_csv(path, scale=2.)
+    mtime = os.path.getmtime(path) + 10
+    os.utime(path, (mtime, mtime))
+    assert data.csv('AAA', path=path).iloc[-1] == 8.
+    # the old version was dropped
+    assert len(data._parse_csv.mcache) == 1
+
+
+def test_csv_cache_bounded(tmpdir, monkeypatch):
+    calls = count_parses(monkeypatch)
+    paths = [str(tmpdir.join('p%d.csv' % k))
+             for k in range(data.CSV_MAX_FILES + 2)]
+    for path in paths:
+        write_csv(path)
+        data.csv('AAA', path=path)
+    assert len(data._parse_csv.mcache) == data.CSV_MAX_FILES
+
+    # least recently used files were evicted
+    data.csv('AAA', path=paths[-1])
+    data.csv('AAA', path=paths[0])
+    assert len(calls) == len(paths) + 1
+
+    utils.clear_memoize(data._parse_csv)
+    assert len(data._parse_csv.mcache) == 0
+
+
+def test_panel_store_round_trip(tmpdir):
+    panel = pd.DataFrame(np.arange(10.).reshape(5, 2), index=DATES[:5],
+                         columns=['AAA', 'BBB'])
+    store = data.PanelStore.write(str(tmpdir), panel)
+    assert data.PanelStore(str(tmpdir)).get().equals(panel)
+    assert store.get('BBB')['BBB'].tolist() == panel['BBB'].tolist()
+
+
+def test_panel_store_integer_tickers(tmpdir):
+    panel = pd.DataFrame(np.arange(10.).reshape(5, 2), index=DATES[:5],
+                         columns=[5930, 660])
+    data.PanelStore.write(str(tmpdir), panel)
+    store = data.PanelStore(str(tmpdir))
+    assert store.tickers == [5930, 660]
+    assert store.get().columns.equals(panel.columns)
+    assert store.get(660)[660].tolist() == panel[660].tolist()
+
+    # rewritten with string tickers
+    panel.columns = ['005930', '000660']
+    data.PanelStore.write(str(tmpdir), panel)
+    assert data.PanelStore(str(tmpdir)).tickers == ['005930', '000660']
+
+
+def test_panel_store_rejects_other_tickers(tmpdir):
+    panel = pd.DataFrame(np.arange(10.).reshape(5, 2), index=DATES[:5],
+                         columns=[1.5, 2.5])
+    with pytest.raises(ValueError):
+        data.PanelStore.write(str(tmpdir), panel)
@@ -0,0 +1,64 @@
+from __future__ import division
+import numpy as np
+import pandas as pd
+from KSIF.core import ffn
+
+__author__ = 'Seung Hyeon Yu'
+__email__ = 'rambor12@business.kaist.ac.kr'
+
+
+def make_prices(n_days=300, seed=3):
+    rng = np.random.RandomState(seed)
+    dates = pd.bdate_range('2015-01-01', periods=n_days)
+    steps = rng.normal(0.0002, 0.015, (n_days, 3))
+    prices = pd.DataFrame(100 * np.exp(np.cumsum(steps, axis=0)),
+                          index=dates, columns=['a', 'b', 'c'])
+    prices.iloc[40:45, 1] = np.nan
+    return prices
+
+
+def brute_force(prices, window, fn):
+    res = pd.DataFrame(np.nan, index=prices.index, columns=prices.columns)
+    for k in range(window - 1, len(prices)):
+        res.iloc[k] = prices.iloc[k - window + 1:k + 1].apply(fn)
+    return res
+
+
+def test_rolling_max_drawdown():
+    prices = make_prices()
+    expected = brute_force(prices, 60, ffn.calc_max_drawdown)
+    got = ffn.rolling_max_drawdown(prices, 60)
+    assert np.allclose(got.values, expected.values, equal_nan=True)
+
+
+def test_rolling_vol():
+    prices = make_prices()
+    expected = brute_force(prices, 60,
+                           lambda p: p.pct_change(fill_method=None).std())
+    got = ffn.rolling_vol(prices, 60) / np.sqrt(252)
+    assert np.allclose(got.values, expected.values, equal_nan=True)
+
+
+def test_range_stats_tables_built_lazily():
+    stats = ffn._RangeStats(make_prices())
+    stats.cagr(0, 100)
+    stats.std(0, 100)
+    assert stats._dd is None
+    stats.max_drawdown(0, 100)
+    assert stats._dd is not None
+
+
+def test_rolling_beta_skips_range_stats(monkeypatch):
+    prices = make_prices()
+
+    def fail(_):
+        raise AssertionError('rolling_beta built _RangeStats')
+
+    monkeypatch.setattr(ffn, '_RangeStats', fail)
+    benchmark = prices['a']
+    got = ffn.rolling_beta(prices, benchmark, 60)
+    returns = prices.pct_change(fill_method=None)
+    window = returns.iloc[-59:]
+    beta = window['c'].cov(window['a']) / window['a'].var()
+    assert np.isclose(got['c'].iloc[-1], beta)
+    assert np.allclose(got['a'].dropna(), 1.)
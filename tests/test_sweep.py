@@ -0,0 +1,78 @@
+from __future__ import division
+import threading
+import time
+import numpy as np
+import pandas as pd
+import pytest
+import KSIF as kf
+from KSIF.core import algos
+from KSIF.core import sweep as sweeps
+from KSIF.core.base import Strategy
+
+__author__ = 'Seung Hyeon Yu'
+__email__ = 'rambor12@business.kaist.ac.kr'
+
+
+def make_prices(n_tickers=6, n_days=120, seed=5):
+    rng = np.random.RandomState(seed)
+    dates = pd.bdate_range('2018-01-01', periods=n_days)
+    steps = rng.normal(0.0003, 0.02, (n_days, n_tickers))
+    return pd.DataFrame(1000 * np.exp(np.cumsum(steps, axis=0)),
+                        index=dates,
+                        columns=['s%d' % i for i in range(n_tickers)])
+
+
+def factory(n):
+    return Strategy('s', [algos.RunMonthly(), algos.SelectAll(),
+                          algos.SelectMomentum(n=n, lookback=pd.DateOffset(
+                              months=1)),
+                          algos.WeighEqually(), algos.Rebalance()])
+
+
+def echo(task, state=None):
+    time.sleep(0.01)
+    if state is None:
+        state = sweeps._WORKER['state']
+    return task, state
+
+
+def test_sweep_leaves_no_state():
+    data = make_prices()
+    serial = kf.sweep(factory, data, {'n': [2, 3]}, n_jobs=1)
+    assert sweeps._WORKER == {}
+    threads = kf.sweep(factory, data, {'n': [2, 3]}, n_jobs=2,
+                       backend='thread')
+    assert sweeps._WORKER == {}
+    for label in serial:
+        assert serial[label].prices.equals(threads[label].prices)
+
+
+def test_concurrent_thread_maps_keep_own_state():
+    results = {}
+
+    def run(name):
+        results[name] = sweeps._map(echo, list(range(8)), name, n_jobs=4,
+                                    backend='thread')
+
+    workers = [threading.Thread(target=run, args=(name,))
+               for name in ('a', 'b')]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+
+    for name in ('a', 'b'):
+        assert results[name] == [(k, name) for k in range(8)]
+
+
+def test_unknown_backend(monkeypatch):
+    def fail(*args):
+        raise AssertionError('precompute ran')
+
+    monkeypatch.setattr(sweeps, 'precompute', fail)
+    data = make_prices()
+    with pytest.raises(ValueError):
+        kf.sweep(factory, data, {'n': [2, 3]}, n_jobs=2, backend='dask')
+    with pytest.raises(ValueError):
+        kf.walk_forward(factory, data, {'n': [2, 3]}, 40, 20,
+                        backend='dask')
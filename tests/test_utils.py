@@ -0,0 +1,68 @@
+from __future__ import division
+import gc
+import os
+import weakref
+import numpy as np
+import pandas as pd
+import pytest
+import KSIF.core.utils as utils
+
+__author__ = 'Seung Hyeon Yu'
+__email__ = 'rambor12@business.kaist.ac.kr'
+
+
+@pytest.fixture
+def cache_dir(tmpdir):
+    utils.set_cache_dir(str(tmpdir))
+    yield str(tmpdir)
+    utils.set_cache_dir(None)
+
+
+def stored(path):
+    return [f for _, _, files in os.walk(path) for f in files]
+
+
+def test_disk_write_replaces(cache_dir):
+    values = [pd.Series([1., 2.])]
+
+    @utils.disk_memoize
+    def provider(ticker, mrefresh=False):
+        return values[0]
+
+    provider('AAA')
+    values[0] = pd.Series([3.])
+    assert provider('AAA').tolist() == [1., 2.]
+    assert provider('AAA', mrefresh=True).tolist() == [3.]
+    assert provider('AAA').tolist() == [3.]
+    assert len(stored(cache_dir)) == 1
+
+
+def test_disk_write_failure_leaves_no_temp_file(cache_dir):
+    @utils.disk_memoize
+    def provider(ticker, mrefresh=False):
+        # lambdas can not be pickled
+        return lambda: ticker
+
+    with pytest.raises(Exception):
+        provider('AAA')
+    assert stored(cache_dir) == []
+
+
+def test_memoize_does_not_keep_arguments():
+    @utils.memoize
+    def total(prices, scale=1.):
+        return float(prices.sum().sum()) * scale
+
+    prices = pd.DataFrame(np.arange(6.).reshape(3, 2))
+    ref = weakref.ref(prices)
+    assert total(prices) == 15.
+    assert total(pd.DataFrame(np.arange(6.).reshape(3, 2))) == 15.
+    assert total.mstats['hits'] == 1
+    assert utils.memoize_get(total, prices) == (True, 15.)
+
+    del prices
+    gc.collect()
+    assert ref() is None
+    # arguments are kept by fingerprint for memoize_forget
+    assert utils.memoize_forget(
+        total, lambda args: args['prices'][0] == 'DataFrame') == 1